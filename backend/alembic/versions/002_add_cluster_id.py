@@ -0,0 +1,33 @@
+"""add cluster id to virtual machines
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Existing VMs belong to the single cluster configured so far
+    op.add_column(
+        'virtual_machines',
+        sa.Column('cluster_id', sa.String(50), nullable=False, server_default='default')
+    )
+    op.create_index(
+        'ix_virtual_machines_cluster_proxmox',
+        'virtual_machines',
+        ['cluster_id', 'proxmox_id']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_virtual_machines_cluster_proxmox', table_name='virtual_machines')
+    op.drop_column('virtual_machines', 'cluster_id')
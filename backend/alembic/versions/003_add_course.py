@@ -0,0 +1,25 @@
+"""add course to virtual machines
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('virtual_machines', sa.Column('course', sa.String(100), nullable=True))
+    op.create_index('ix_virtual_machines_course', 'virtual_machines', ['course'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_virtual_machines_course', table_name='virtual_machines')
+    op.drop_column('virtual_machines', 'course')
@@ -0,0 +1,66 @@
+"""add usage accounting tables
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'usage_events',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('vm_id', sa.Integer(), nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=True),
+        sa.Column('course', sa.String(100), nullable=True),
+        sa.Column('event', sa.Enum('CREATED', 'STARTED', 'STOPPED', 'RESIZED', 'DELETED', name='usageeventtype'), nullable=False),
+        sa.Column('cpu_cores', sa.Integer(), nullable=False),
+        sa.Column('memory_mb', sa.Integer(), nullable=False),
+        sa.Column('occurred_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_usage_events_vm_occurred', 'usage_events', ['vm_id', 'occurred_at'])
+    op.create_index('ix_usage_events_occurred_at', 'usage_events', ['occurred_at'])
+
+    op.create_table(
+        'usage_state',
+        sa.Column('vm_id', sa.Integer(), nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=True),
+        sa.Column('course', sa.String(100), nullable=True),
+        sa.Column('running', sa.Boolean(), nullable=False, default=False),
+        sa.Column('cpu_cores', sa.Integer(), nullable=False),
+        sa.Column('memory_mb', sa.Integer(), nullable=False),
+        sa.Column('accounted_until', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('vm_id')
+    )
+
+    op.create_table(
+        'usage_daily',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('vm_id', sa.Integer(), nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=True),
+        sa.Column('course', sa.String(100), nullable=True),
+        sa.Column('running_seconds', sa.BigInteger(), nullable=False, default=0),
+        sa.Column('core_seconds', sa.BigInteger(), nullable=False, default=0),
+        sa.Column('mb_seconds', sa.BigInteger(), nullable=False, default=0),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('day', 'vm_id', name='uq_usage_daily_day_vm')
+    )
+    op.create_index('ix_usage_daily_owner_day', 'usage_daily', ['owner_id', 'day'])
+    op.create_index('ix_usage_daily_course_day', 'usage_daily', ['course', 'day'])
+
+
+def downgrade() -> None:
+    op.drop_table('usage_daily')
+    op.drop_table('usage_state')
+    op.drop_table('usage_events')
@@ -0,0 +1,38 @@
+"""add node drain jobs
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'node_drains',
+        sa.Column('id', sa.String(32), nullable=False),
+        sa.Column('cluster_id', sa.String(50), nullable=False),
+        sa.Column('node', sa.String(100), nullable=False),
+        sa.Column('status', sa.String(20), nullable=False),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('moves', sa.JSON(), nullable=False),
+        sa.Column('active_key', sa.String(160), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=False),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.Column('heartbeat_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('active_key')
+    )
+    op.create_index('ix_node_drains_finished_at', 'node_drains', ['finished_at'])
+
+
+def downgrade() -> None:
+    op.drop_table('node_drains')
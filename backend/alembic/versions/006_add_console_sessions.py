@@ -0,0 +1,48 @@
+"""add console sessions and connections
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'console_connections',
+        sa.Column('vm_id', sa.Integer(), nullable=False),
+        sa.Column('protocol', sa.String(10), nullable=False),
+        sa.Column('connection_id', sa.String(64), nullable=False),
+        sa.Column('parameters', sa.JSON(), nullable=False),
+        sa.Column('last_used', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('vm_id', 'protocol')
+    )
+
+    op.create_table(
+        'console_sessions',
+        sa.Column('id', sa.String(32), nullable=False),
+        sa.Column('vm_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('protocol', sa.String(10), nullable=False),
+        sa.Column('connection_id', sa.String(64), nullable=False),
+        sa.Column('client_identifier', sa.String(255), nullable=False),
+        sa.Column('guacamole_user', sa.String(64), nullable=False),
+        sa.Column('guacamole_token', sa.String(255), nullable=False),
+        sa.Column('last_seen', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_console_sessions_vm_id', 'console_sessions', ['vm_id'])
+    op.create_index('ix_console_sessions_last_seen', 'console_sessions', ['last_seen'])
+
+
+def downgrade() -> None:
+    op.drop_table('console_sessions')
+    op.drop_table('console_connections')
@@ -0,0 +1,30 @@
+"""add provisioned_by to virtual machines
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('virtual_machines', sa.Column('provisioned_by', sa.Integer(), nullable=True))
+    op.create_index('ix_virtual_machines_provisioned_by', 'virtual_machines', ['provisioned_by'])
+    op.create_foreign_key(
+        'fk_virtual_machines_provisioned_by', 'virtual_machines', 'users',
+        ['provisioned_by'], ['id'], ondelete='SET NULL'
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint('fk_virtual_machines_provisioned_by', 'virtual_machines', type_='foreignkey')
+    op.drop_index('ix_virtual_machines_provisioned_by', table_name='virtual_machines')
+    op.drop_column('virtual_machines', 'provisioned_by')
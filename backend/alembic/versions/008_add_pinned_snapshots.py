@@ -0,0 +1,32 @@
+"""add pinned snapshots
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'pinned_snapshots',
+        sa.Column('vm_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(40), nullable=False),
+        sa.Column('pinned_by', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['vm_id'], ['virtual_machines.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['pinned_by'], ['users.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('vm_id', 'name')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('pinned_snapshots')
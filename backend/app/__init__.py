@@ -0,0 +1,9 @@
+"""Lab Management System backend.
+
+``.env`` is loaded here, once, before any module of the package reads its
+settings, whichever entry point (uvicorn, gunicorn, Alembic, benchmarks)
+imports the package first. Variables already set in the environment win.
+"""
+from dotenv import load_dotenv
+
+load_dotenv()
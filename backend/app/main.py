@@ -1,20 +1,99 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
+from typing import IO
+import asyncio
 import os
-from dotenv import load_dotenv
+import tempfile
 
-from .routers import auth, virtual_machine
-from .database import init_db
+from .routers import auth, virtual_machine, console, cluster, node, usage
+from .database import check_schema, dispose_engine
+from .services.guacamole import console_broker
+from .services.discovery import network_discovery
+from .services.task_tailer import TASK_TAIL_INTERVAL, task_tailer
+from .services.snapshots import snapshot_pruner
+from .services.accounting import usage_accountant
 
-# Load environment variables
-load_dotenv()
+BACKGROUND_TASKS = os.getenv("BACKGROUND_TASKS", "true").lower() == "true"
+BACKGROUND_LOCK_FILE = os.getenv(
+    "BACKGROUND_LOCK_FILE",
+    os.path.join(tempfile.gettempdir(), "lab-management-background.lock")
+)
+BACKGROUND_LOCK_RETRY = int(os.getenv("BACKGROUND_LOCK_RETRY_SECONDS", "5"))
+
+def _try_background_lock(lock_file: IO) -> bool:
+    """Try to lock ``BACKGROUND_LOCK_FILE`` without waiting.
+
+    The lock is held until the file is closed or the process exits.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return True  # No flock on Windows, where only one worker runs
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+async def _run_background_tasks(lock_file: IO) -> None:
+    """Run the cluster-wide background loops once this worker holds the lock.
+
+    Console cleanup, discovery, task tailing, snapshot pruning and usage
+    accounting must run once per deployment, not once per worker. Every
+    worker keeps trying the lock, so when its holder exits (e.g. an old
+    worker during a rolling restart) another worker takes over. Until then
+    this worker only follows tasks to keep its node cache current.
+    """
+    task_tailer.start(apply=False)
+    while not _try_background_lock(lock_file):
+        await asyncio.sleep(BACKGROUND_LOCK_RETRY)
+    await task_tailer.stop()
+    # Cover tasks that finished after the previous holder stopped polling
+    task_tailer.replay(BACKGROUND_LOCK_RETRY + TASK_TAIL_INTERVAL)
+    console_broker.start()
+    network_discovery.start()
+    task_tailer.start()
+    snapshot_pruner.start()
+    usage_accountant.start()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop the resources of one worker process.
+
+    The database engine and Proxmox clients are created on first use inside
+    the worker, so startup opens no connections beyond the schema check,
+    which gunicorn's master runs once for all workers (see gunicorn.conf.py).
+    """
+    check_schema()
+    lock_file = open(BACKGROUND_LOCK_FILE, "a") if BACKGROUND_TASKS else None
+    if lock_file:
+        background = asyncio.get_running_loop().create_task(_run_background_tasks(lock_file))
+    else:
+        background = None
+        # Only follow migrations, so this worker's node cache stays current
+        task_tailer.start(apply=False)
+    try:
+        yield
+    finally:
+        if background:
+            background.cancel()
+        await task_tailer.stop()
+        await console_broker.stop()
+        await network_discovery.stop()
+        await snapshot_pruner.stop()
+        await usage_accountant.stop()
+        if lock_file:
+            lock_file.close()
+        dispose_engine()
 
 # Create FastAPI app
 app = FastAPI(
     title="Lab Management System",
     description="API for managing virtual machines and containers in a lab environment",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -29,11 +108,10 @@ app.add_middleware(
 # Include routers
 app.include_router(auth.router)
 app.include_router(virtual_machine.router)
-
-@app.on_event("startup")
-async def startup_event():
-    """Initialize database on startup."""
-    init_db()
+app.include_router(console.router)
+app.include_router(cluster.router)
+app.include_router(node.router)
+app.include_router(usage.router)
 
 @app.get("/")
 async def root():
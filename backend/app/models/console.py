@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, String, JSON, DateTime
+from .base import Base
+from datetime import datetime
+
+class ConsoleConnection(Base):
+    """A Guacamole connection definition kept warm for one VM and protocol."""
+    __tablename__ = "console_connections"
+
+    vm_id = Column(Integer, primary_key=True, autoincrement=False)
+    protocol = Column(String(10), primary_key=True)
+    connection_id = Column(String(64), nullable=False)
+    parameters = Column(JSON, nullable=False)
+    last_used = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class ConsoleSession(Base):
+    """An open console, with the Guacamole user created for it."""
+    __tablename__ = "console_sessions"
+
+    id = Column(String(32), primary_key=True)
+    vm_id = Column(Integer, nullable=False, index=True)
+    user_id = Column(Integer, nullable=False)
+    protocol = Column(String(10), nullable=False)
+    connection_id = Column(String(64), nullable=False)
+    client_identifier = Column(String(255), nullable=False)
+    guacamole_user = Column(String(64), nullable=False)
+    guacamole_token = Column(String(255), nullable=False)
+    last_seen = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
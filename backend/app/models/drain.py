@@ -0,0 +1,24 @@
+from sqlalchemy import Column, String, Text, JSON, DateTime
+from .base import Base
+from datetime import datetime
+
+class NodeDrain(Base):
+    """A node drain job, shared by all worker processes.
+
+    ``active_key`` is ``<cluster_id>/<node>`` while the job is planning or
+    running and ``NULL`` afterwards; its unique constraint keeps two workers
+    from draining the same node at once.
+    """
+    __tablename__ = "node_drains"
+
+    id = Column(String(32), primary_key=True)
+    cluster_id = Column(String(50), nullable=False)
+    node = Column(String(100), nullable=False)
+    status = Column(String(20), nullable=False)
+    error = Column(Text)
+    moves = Column(JSON, nullable=False)
+    active_key = Column(String(160), unique=True)
+    started_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = Column(DateTime, index=True)
+    # Refreshed by the worker running the job; a stale one means that worker died
+    heartbeat_at = Column(DateTime, nullable=False, default=datetime.utcnow)
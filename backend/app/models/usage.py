@@ -0,0 +1,57 @@
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, Enum, Date, DateTime, Index, UniqueConstraint
+from .base import Base
+from datetime import datetime
+import enum
+
+class UsageEventType(enum.Enum):
+    CREATED = "created"
+    STARTED = "started"
+    STOPPED = "stopped"
+    RESIZED = "resized"
+    DELETED = "deleted"
+
+class UsageEvent(Base):
+    """A VM state transition, kept as a compact append-only log."""
+    __tablename__ = "usage_events"
+    __table_args__ = (
+        Index("ix_usage_events_vm_occurred", "vm_id", "occurred_at"),
+    )
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    vm_id = Column(Integer, nullable=False)
+    owner_id = Column(Integer)
+    course = Column(String(100))
+    event = Column(Enum(UsageEventType), nullable=False)
+    cpu_cores = Column(Integer, nullable=False)
+    memory_mb = Column(Integer, nullable=False)
+    occurred_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+class UsageState(Base):
+    """Accounting cursor per VM: what it currently consumes and until when it was counted."""
+    __tablename__ = "usage_state"
+
+    vm_id = Column(Integer, primary_key=True, autoincrement=False)
+    owner_id = Column(Integer)
+    course = Column(String(100))
+    running = Column(Boolean, nullable=False, default=False)
+    cpu_cores = Column(Integer, nullable=False)
+    memory_mb = Column(Integer, nullable=False)
+    accounted_until = Column(DateTime, nullable=False)
+
+class UsageDaily(Base):
+    """Precomputed per-VM, per-day usage totals that reports are served from."""
+    __tablename__ = "usage_daily"
+    __table_args__ = (
+        UniqueConstraint("day", "vm_id", name="uq_usage_daily_day_vm"),
+        Index("ix_usage_daily_owner_day", "owner_id", "day"),
+        Index("ix_usage_daily_course_day", "course", "day"),
+    )
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    day = Column(Date, nullable=False)
+    vm_id = Column(Integer, nullable=False)
+    owner_id = Column(Integer)
+    course = Column(String(100))
+    running_seconds = Column(BigInteger, nullable=False, default=0)
+    core_seconds = Column(BigInteger, nullable=False, default=0)
+    mb_seconds = Column(BigInteger, nullable=False, default=0)
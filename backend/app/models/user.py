@@ -20,7 +20,9 @@ class User(BaseModel):
     is_active = Column(Boolean, default=True)
     
     # Relationships
-    virtual_machines = relationship("VirtualMachine", back_populates="owner")
+    virtual_machines = relationship(
+        "VirtualMachine", back_populates="owner", foreign_keys="VirtualMachine.owner_id"
+    )
     
     def __repr__(self):
         return f"<User {self.username}>"
\ No newline at end of file
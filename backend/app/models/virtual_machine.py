@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Boolean, Enum, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, Boolean, Enum, ForeignKey, Float, Index, DateTime
 from sqlalchemy.orm import relationship
 from .base import Base, BaseModel
+from datetime import datetime
 import enum
 
 class VMType(enum.Enum):
@@ -15,6 +16,9 @@ class VMStatus(enum.Enum):
 
 class VirtualMachine(BaseModel):
     __tablename__ = "virtual_machines"
+    __table_args__ = (
+        Index("ix_virtual_machines_cluster_proxmox", "cluster_id", "proxmox_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), nullable=False)
@@ -22,6 +26,7 @@ class VirtualMachine(BaseModel):
     status = Column(Enum(VMStatus), nullable=False, default=VMStatus.STOPPED)
     
     # Proxmox details
+    cluster_id = Column(String(50), nullable=False, default="default")
     proxmox_id = Column(Integer, nullable=False)
     proxmox_node = Column(String(100), nullable=False)
     
@@ -45,22 +50,45 @@ class VirtualMachine(BaseModel):
     memory_usage = Column(Float, default=0.0)   # percentage
     disk_usage = Column(Float, default=0.0)     # percentage
     
+    # Course the VM was provisioned for, used for course-wide operations
+    course = Column(String(100), index=True)
+    
     # Owner
     owner_id = Column(Integer, ForeignKey("users.id"))
-    owner = relationship("User", back_populates="virtual_machines")
+    owner = relationship("User", back_populates="virtual_machines", foreign_keys=[owner_id])
+    
+    # User who created the VM, e.g. the teacher who provisioned a course
+    provisioned_by = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), index=True)
     
     def __repr__(self):
         return f"<VirtualMachine {self.name} ({self.vm_type.value})>"
 
+    @property
+    def owner_name(self):
+        return self.owner.username if self.owner else None
+
+    @property
+    def resource_status(self):
+        return {
+            "cpu": self.cpu_usage,
+            "memory": self.memory_usage,
+            "disk": self.disk_usage
+        }
+
     def to_dict(self):
         """Convert to dictionary with additional computed fields."""
         base_dict = super().to_dict()
         base_dict.update({
-            "owner_name": self.owner.username if self.owner else None,
-            "resource_status": {
-                "cpu": self.cpu_usage,
-                "memory": self.memory_usage,
-                "disk": self.disk_usage
-            }
+            "owner_name": self.owner_name,
+            "resource_status": self.resource_status
         })
-        return base_dict
\ No newline at end of file
+        return base_dict
+
+class PinnedSnapshot(Base):
+    """A snapshot retention pruning never deletes, e.g. a teacher's exam checkpoint."""
+    __tablename__ = "pinned_snapshots"
+
+    vm_id = Column(Integer, ForeignKey("virtual_machines.id", ondelete="CASCADE"), primary_key=True)
+    name = Column(String(40), primary_key=True)
+    pinned_by = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"))
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
@@ -0,0 +1,45 @@
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException
+from typing import List
+from ..models.user import User, UserRole
+from ..schemas.cluster import ClusterSummary
+from ..routers.auth import get_current_user
+from ..services.clusters import cluster_registry
+from ..services.proxmox import ProxmoxService
+
+router = APIRouter(prefix="/clusters", tags=["clusters"])
+
+@router.get("/", response_model=List[ClusterSummary])
+async def list_clusters(
+    current_user: User = Depends(get_current_user)
+):
+    """List all Proxmox clusters with their nodes, querying them in parallel."""
+    if current_user.role == UserRole.STUDENT:
+        raise HTTPException(status_code=403, detail="Not authorized to view clusters")
+
+    loop = asyncio.get_running_loop()
+
+    async def summarize(cluster_id: str):
+        proxmox = await ProxmoxService.connect(cluster_id)
+        nodes, guests = await asyncio.gather(
+            loop.run_in_executor(None, proxmox.proxmox.nodes.get),
+            loop.run_in_executor(None, proxmox.get_cluster_guests)
+        )
+        return nodes, len(guests)
+
+    results = await cluster_registry.fan_out(summarize)
+
+    clusters = []
+    for cluster_id, result in results.items():
+        summary = {"id": cluster_id, "is_default": cluster_id == cluster_registry.default}
+        if isinstance(result, Exception):
+            cluster_registry.reset(cluster_id)
+            summary.update(reachable=False, error=str(result))
+        else:
+            nodes, guests = result
+            summary.update(reachable=True, guests=guests, nodes=[
+                {key: node.get(key) for key in ("node", "status", "cpu", "maxcpu", "mem", "maxmem")}
+                for node in nodes
+            ])
+        clusters.append(summary)
+    return clusters
@@ -0,0 +1,57 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from ..models.user import User, UserRole
+from ..models.virtual_machine import VirtualMachine
+from ..schemas.console import ConsoleOpen, ConsoleSession
+from ..database import get_db
+from ..routers.auth import get_current_user
+from ..services.guacamole import console_broker
+
+router = APIRouter(prefix="/console", tags=["console"])
+
+@router.post("/{vm_id}", response_model=ConsoleSession)
+async def open_console(
+    vm_id: int,
+    console: ConsoleOpen = ConsoleOpen(),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Open a remote console session on a VM."""
+    vm = db.query(VirtualMachine).filter(VirtualMachine.id == vm_id).first()
+    if not vm:
+        raise HTTPException(status_code=404, detail="VM not found")
+
+    if current_user.role != UserRole.ADMIN and vm.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to access this VM")
+
+    try:
+        return await console_broker.open_session(vm, current_user.id, console.protocol)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Failed to open console: {str(e)}"
+        )
+
+@router.post("/sessions/{session_token}/keepalive", response_model=ConsoleSession)
+async def keepalive_console(
+    session_token: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Keep a console session alive and get a fresh session token."""
+    try:
+        return await console_broker.keepalive(session_token, current_user.id)
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.delete("/sessions/{session_token}")
+async def close_console(
+    session_token: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Close a console session."""
+    try:
+        await console_broker.close_session(session_token, current_user.id)
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    return {"detail": "Console session closed"}
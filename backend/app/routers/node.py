@@ -0,0 +1,64 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from ..database import get_db
+from ..models.user import User, UserRole
+from ..schemas.node import NodeDrainRequest, DrainJobResponse
+from ..routers.auth import get_current_user
+from ..services.clusters import cluster_registry
+from ..services.drain import DrainConflict, DrainJob, get_drain_job, prune_drain_jobs
+
+router = APIRouter(prefix="/nodes", tags=["nodes"])
+
+@router.post("/{node}/drain", response_model=DrainJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def drain_node(
+    node: str,
+    drain: NodeDrainRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Migrate all guests off a node, e.g. before maintenance."""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Only admins can drain nodes")
+
+    try:
+        cluster_id = cluster_registry.resolve(drain.cluster_id)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    job = DrainJob(
+        cluster_id,
+        node,
+        targets=drain.targets,
+        max_parallel_per_source=drain.max_parallel_per_source,
+        max_parallel_per_target=drain.max_parallel_per_target,
+        include_stopped=drain.include_stopped,
+        with_local_disks=drain.with_local_disks,
+        memory_headroom=drain.memory_headroom
+    )
+    if drain.dry_run:
+        await job.run(dry_run=True)
+        return job.to_dict()
+
+    prune_drain_jobs(db)
+    try:
+        job.claim(db)
+    except DrainConflict as e:
+        raise HTTPException(status_code=409, detail=f"Node {node} is already being drained by job {e.job_id}")
+    job.start()
+    return job.to_dict()
+
+@router.get("/drains/{job_id}", response_model=DrainJobResponse)
+async def get_drain(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the progress of a drain job."""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Only admins can view drain jobs")
+
+    prune_drain_jobs(db)
+    job = get_drain_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Drain job not found")
+    return job
@@ -0,0 +1,72 @@
+import csv
+import io
+from datetime import date
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from ..models.user import User, UserRole
+from ..schemas.usage import UsageReportRow
+from ..database import get_db, SessionLocal
+from ..routers.auth import get_current_user
+from ..services.accounting import usage_report, iter_usage_rows, REPORT_GROUPS
+
+router = APIRouter(prefix="/usage", tags=["usage"])
+
+def _report_scope(start: date, end: date, current_user: User) -> Optional[int]:
+    """Validate the period and return the owner id students are restricted to."""
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    return current_user.id if current_user.role == UserRole.STUDENT else None
+
+@router.get("/report", response_model=List[UsageReportRow])
+async def get_usage_report(
+    start: date,
+    end: date,
+    group_by: str = Query("user", regex="^(" + "|".join(REPORT_GROUPS) + ")$"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Core-hours, GB-hours and running hours per user, course or VM, from the daily rollups."""
+    owner_id = _report_scope(start, end, current_user)
+    return usage_report(db, start, end, group_by, owner_id)
+
+@router.get("/export.csv")
+async def export_usage(
+    start: date,
+    end: date,
+    current_user: User = Depends(get_current_user)
+):
+    """Stream the daily rollups of a period as CSV."""
+    owner_id = _report_scope(start, end, current_user)
+
+    def rows():
+        # The response outlives the request dependencies, so use an own session
+        db = SessionLocal()
+        try:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(["day", "vm_id", "owner_id", "course", "running_hours", "core_hours", "gb_hours"])
+            for i, row in enumerate(iter_usage_rows(db, start, end, owner_id), 1):
+                writer.writerow([
+                    row.day.isoformat(),
+                    row.vm_id,
+                    row.owner_id,
+                    row.course or "",
+                    round(row.running_seconds / 3600, 4),
+                    round(row.core_seconds / 3600, 4),
+                    round(row.mb_seconds / 1024 / 3600, 4)
+                ])
+                if i % 1000 == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        finally:
+            db.close()
+
+    return StreamingResponse(
+        rows(),
+        media_type="text/csv",
+        headers={"Content-Disposition": f"attachment; filename=usage-{start}-{end}.csv"}
+    )
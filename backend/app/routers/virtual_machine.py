@@ -1,12 +1,26 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert, or_
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Any, Dict, List, Set
+import asyncio
+import json
+from collections import defaultdict
 from ..models.user import User, UserRole
-from ..models.virtual_machine import VirtualMachine, VMStatus
-from ..schemas.virtual_machine import VMCreate, VMUpdate, VMResponse, VMAction
-from ..database import get_db
+from ..models.virtual_machine import PinnedSnapshot, VirtualMachine, VMStatus
+from ..schemas.virtual_machine import (
+    VMCreate, VMUpdate, VMResponse, VMAction, VMBatchCreate, VMBatchResponse,
+    VMBulkAction, VMBulkActionItem, VMBulkSnapshot,
+    SnapshotCreate, SnapshotRollback, SnapshotResponse
+)
+from ..database import SessionLocal, get_db
 from ..routers.auth import get_current_user
 from ..services.proxmox import ProxmoxService
+from ..services.clusters import cluster_registry
+from ..services.guacamole import console_broker
+from ..services.discovery import network_discovery
+from ..services.accounting import record_event, record_events, ACTION_EVENTS
+from ..models.usage import UsageEventType
 
 router = APIRouter(prefix="/vm", tags=["virtual machines"])
 
@@ -36,7 +50,10 @@ async def create_vm(
             detail="Students can only create VMs for themselves"
         )
     
-    proxmox = ProxmoxService()
+    try:
+        proxmox = await ProxmoxService.connect(vm_data.cluster_id)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     
     # Create VM in Proxmox
     try:
@@ -56,17 +73,352 @@ async def create_vm(
     
     # Create VM record in database
     db_vm = VirtualMachine(
-        **vm_data.dict(),
+        **vm_data.dict(exclude={"cluster_id", "owner_id"}),
+        cluster_id=proxmox.cluster_id,
         proxmox_id=proxmox_id,
         owner_id=vm_data.owner_id or current_user.id,
+        provisioned_by=current_user.id,
         status=VMStatus.STOPPED
     )
     
     db.add(db_vm)
+    db.flush()
+    record_event(db, db_vm, UsageEventType.CREATED)
     db.commit()
     db.refresh(db_vm)
     return db_vm
 
+# Batches keep running when their client disconnects, so every VM they
+# create still gets its database row
+_running_batches: Set[asyncio.Task] = set()
+
+def _batch_item(result: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "index": result["index"],
+        "owner_id": result["owner_id"],
+        "name": result["name"],
+        "proxmox_id": result["vmid"],
+        "proxmox_node": result["node"],
+        "status": result["status"],
+        "error": result["error"],
+        "vm_id": result.get("vm_id")
+    }
+
+def _record_batch(
+    db: Session, batch: VMBatchCreate, cluster_id: str, provisioned_by: int, results: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Insert a row for every VM the batch created and build the response."""
+    created = [result for result in results if result["status"] == "created"]
+    if created:
+        # One multi-row INSERT. MySQL has no RETURNING, so the new ids are
+        # read back by Proxmox ID (the newest row wins over any stale one).
+        db.execute(insert(VirtualMachine).values([
+            {
+                "name": result["name"],
+                "vm_type": batch.vm_type,
+                "cpu_cores": batch.cpu_cores,
+                "memory_mb": batch.memory_mb,
+                "disk_size": batch.disk_size,
+                "rdp_enabled": batch.rdp_enabled,
+                "ssh_enabled": batch.ssh_enabled,
+                "course": batch.course,
+                "cluster_id": cluster_id,
+                "proxmox_id": result["vmid"],
+                "proxmox_node": result["node"],
+                "owner_id": result["owner_id"],
+                "provisioned_by": provisioned_by,
+                "status": VMStatus.STOPPED
+            }
+            for result in created
+        ]))
+        db_vms = {
+            vm.proxmox_id: vm
+            for vm in db.query(VirtualMachine).filter(
+                VirtualMachine.cluster_id == cluster_id,
+                VirtualMachine.proxmox_id.in_([result["vmid"] for result in created])
+            ).order_by(VirtualMachine.id)
+        }
+        for result in created:
+            result["vm_id"] = db_vms[result["vmid"]].id
+        record_events(db, db_vms.values(), UsageEventType.CREATED)
+    db.commit()
+
+    return {
+        "total": len(results),
+        "created": len(created),
+        "failed": sum(1 for result in results if result["status"] == "failed"),
+        "items": [_batch_item(result) for result in results]
+    }
+
+@router.post("/batch", response_model=VMBatchResponse)
+async def create_vm_batch(
+    batch: VMBatchCreate,
+    stream: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Create one VM per owner with a shared spec, e.g. a whole class lab.
+
+    With ``stream=true`` the response is NDJSON: an ``item`` line whenever
+    an item is created, fails or is rolled back, then one ``done`` line
+    with the full result (or an ``error`` line).
+    """
+    if current_user.role == UserRole.STUDENT:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only teachers and admins can provision VMs in batch"
+        )
+
+    owners = {
+        user.id: user
+        for user in db.query(User).filter(User.id.in_(batch.owner_ids)).all()
+    }
+    missing = [owner_id for owner_id in batch.owner_ids if owner_id not in owners]
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown owner ids: {missing}"
+        )
+
+    items = [
+        {"owner_id": owner_id, "name": f"{batch.name_prefix}-{owners[owner_id].username}"}
+        for owner_id in batch.owner_ids
+    ]
+
+    try:
+        proxmox = await ProxmoxService.connect(batch.cluster_id)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    progress: asyncio.Queue = asyncio.Queue()
+    provisioned_by = current_user.id
+
+    async def provision() -> Dict[str, Any]:
+        try:
+            results = await proxmox.create_vms_batch(
+                items,
+                vm_type=batch.vm_type,
+                cpu_cores=batch.cpu_cores,
+                memory_mb=batch.memory_mb,
+                disk_size=batch.disk_size,
+                nodes=batch.nodes,
+                template=batch.template,
+                per_node_limit=batch.per_node_limit,
+                rollback_on_failure=batch.rollback_on_failure,
+                on_progress=lambda result: progress.put_nowait({"event": "item", **_batch_item(result)})
+            )
+        except Exception as e:
+            raise Exception(f"Failed to create VMs in Proxmox: {str(e)}")
+        batch_db = SessionLocal()
+        try:
+            return _record_batch(batch_db, batch, proxmox.cluster_id, provisioned_by, results)
+        finally:
+            batch_db.close()
+
+    task = asyncio.get_running_loop().create_task(provision())
+    _running_batches.add(task)
+    task.add_done_callback(_running_batches.discard)
+    task.add_done_callback(lambda _: progress.put_nowait(None))
+
+    if not stream:
+        try:
+            return await asyncio.shield(task)
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+    async def lines():
+        while True:
+            event = await progress.get()
+            if event is None:
+                break
+            yield json.dumps(event) + "\n"
+        try:
+            yield json.dumps({"event": "done", **task.result()}) + "\n"
+        except Exception as e:
+            yield json.dumps({"event": "error", "detail": str(e)}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+def _managed_by(user: User):
+    """Filter for VMs a non-admin may operate on: owned or provisioned by them."""
+    return or_(VirtualMachine.owner_id == user.id, VirtualMachine.provisioned_by == user.id)
+
+@router.post("/bulk-action", response_model=List[VMBulkActionItem])
+async def bulk_vm_action(
+    bulk: VMBulkAction,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Perform one action on many VMs, running all clusters in parallel."""
+    query = db.query(VirtualMachine).filter(VirtualMachine.id.in_(bulk.vm_ids))
+    if current_user.role != UserRole.ADMIN:
+        query = query.filter(_managed_by(current_user))
+    vms = query.all()
+    if len(vms) != len(set(bulk.vm_ids)):
+        raise HTTPException(status_code=404, detail="Some VMs were not found or are not accessible")
+
+    by_cluster = defaultdict(list)
+    for vm in vms:
+        by_cluster[vm.cluster_id].append(vm)
+
+    async def run(cluster_id: str):
+        proxmox = await ProxmoxService.connect(cluster_id)
+        return await proxmox.vm_action_bulk(
+            {vm.proxmox_id: vm.vm_type for vm in by_cluster[cluster_id]},
+            bulk.action,
+            bulk.per_node_limit
+        )
+
+    results = await cluster_registry.fan_out(run, list(by_cluster))
+
+    status_map = {
+        "start": VMStatus.RUNNING,
+        "stop": VMStatus.STOPPED,
+        "restart": VMStatus.RUNNING,
+        "suspend": VMStatus.SUSPENDED
+    }
+    items = []
+    succeeded = []
+    for cluster_id, cluster_vms in by_cluster.items():
+        errors = results[cluster_id]
+        for vm in cluster_vms:
+            if isinstance(errors, Exception):
+                error = str(errors)
+            else:
+                error = errors.get(vm.proxmox_id)
+            if error is None:
+                vm.status = status_map.get(bulk.action, vm.status)
+                succeeded.append(vm)
+            items.append({
+                "vm_id": vm.id,
+                "cluster_id": cluster_id,
+                "proxmox_id": vm.proxmox_id,
+                "ok": error is None,
+                "error": error
+            })
+    if bulk.action in ACTION_EVENTS:
+        record_events(db, succeeded, ACTION_EVENTS[bulk.action])
+    db.commit()
+    return items
+
+def _pin_snapshots(db: Session, vm_ids: List[int], name: str, user: User) -> None:
+    """Exempt snapshot ``name`` of these VMs from retention pruning."""
+    if not vm_ids:
+        return
+    db.query(PinnedSnapshot).filter(
+        PinnedSnapshot.vm_id.in_(vm_ids), PinnedSnapshot.name == name
+    ).delete(synchronize_session=False)
+    db.add_all([PinnedSnapshot(vm_id=vm_id, name=name, pinned_by=user.id) for vm_id in vm_ids])
+
+def _select_bulk_vms(bulk: VMBulkSnapshot, current_user: User, db: Session) -> List[VirtualMachine]:
+    """Resolve the VMs of a bulk snapshot operation by id list or course."""
+    if current_user.role == UserRole.STUDENT:
+        raise HTTPException(status_code=403, detail="Only teachers and admins can run bulk snapshot operations")
+    if not bulk.vm_ids and not bulk.course:
+        raise HTTPException(status_code=400, detail="Either vm_ids or course is required")
+
+    query = db.query(VirtualMachine)
+    if current_user.role != UserRole.ADMIN:
+        # Teachers reach the VMs they own or provisioned, e.g. their course's
+        query = query.filter(_managed_by(current_user))
+    if bulk.vm_ids:
+        query = query.filter(VirtualMachine.id.in_(bulk.vm_ids))
+    if bulk.course:
+        query = query.filter(VirtualMachine.course == bulk.course)
+    vms = query.all()
+    if bulk.vm_ids and len(vms) != len(set(bulk.vm_ids)):
+        raise HTTPException(status_code=404, detail="Some VMs were not found or are not accessible")
+    return vms
+
+async def _run_bulk_snapshot(vms: List[VirtualMachine], per_node_limit: int, operation) -> List[dict]:
+    """Await ``operation(proxmox, vm)`` for many VMs, all clusters in parallel."""
+    by_cluster = defaultdict(list)
+    for vm in vms:
+        by_cluster[vm.cluster_id].append(vm)
+
+    async def run(cluster_id: str):
+        proxmox = await ProxmoxService.connect(cluster_id)
+        vms_by_id = {vm.proxmox_id: vm for vm in by_cluster[cluster_id]}
+        return await proxmox.gather_bulk(
+            list(vms_by_id),
+            lambda vmid: operation(proxmox, vms_by_id[vmid]),
+            per_node_limit
+        )
+
+    results = await cluster_registry.fan_out(run, list(by_cluster))
+
+    items = []
+    for cluster_id, cluster_vms in by_cluster.items():
+        errors = results[cluster_id]
+        for vm in cluster_vms:
+            error = str(errors) if isinstance(errors, Exception) else errors.get(vm.proxmox_id)
+            items.append({
+                "vm_id": vm.id,
+                "cluster_id": cluster_id,
+                "proxmox_id": vm.proxmox_id,
+                "ok": error is None,
+                "error": error
+            })
+    return items
+
+@router.post("/bulk-snapshot", response_model=List[VMBulkActionItem])
+async def bulk_snapshot(
+    bulk: VMBulkSnapshot,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Snapshot many VMs, e.g. a whole course before an exam.
+
+    The snapshots are pinned, so retention pruning keeps them however many
+    snapshots the students take afterwards.
+    """
+    vms = _select_bulk_vms(bulk, current_user, db)
+    items = await _run_bulk_snapshot(
+        vms,
+        bulk.per_node_limit,
+        lambda proxmox, vm: proxmox.create_snapshot(vm.proxmox_id, vm.vm_type, bulk.snapshot, bulk.description)
+    )
+    _pin_snapshots(db, [item["vm_id"] for item in items if item["ok"]], bulk.snapshot, current_user)
+    db.commit()
+    return items
+
+@router.post("/bulk-rollback", response_model=List[VMBulkActionItem])
+async def bulk_rollback(
+    bulk: VMBulkSnapshot,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Roll many VMs back to a snapshot, e.g. a whole course."""
+    vms = _select_bulk_vms(bulk, current_user, db)
+    items = await _run_bulk_snapshot(
+        vms,
+        bulk.per_node_limit,
+        lambda proxmox, vm: proxmox.rollback_snapshot(vm.proxmox_id, vm.vm_type, bulk.snapshot, bulk.start)
+    )
+
+    rolled_back = {item["vm_id"] for item in items if item["ok"]}
+    rolled_back_vms = [vm for vm in vms if vm.id in rolled_back]
+    for vm in rolled_back_vms:
+        vm.status = VMStatus.RUNNING if bulk.start else VMStatus.STOPPED
+    record_events(
+        db, rolled_back_vms, UsageEventType.STARTED if bulk.start else UsageEventType.STOPPED
+    )
+    db.commit()
+    return items
+
+@router.post("/discover")
+async def discover_addresses(
+    current_user: User = Depends(get_current_user)
+):
+    """Refresh IP and MAC addresses of all VMs from Proxmox now."""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Only admins can run address discovery")
+
+    try:
+        return await network_discovery.discover()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Address discovery failed: {str(e)}")
+
 @router.get("/{vm_id}", response_model=VMResponse)
 async def get_vm(
     vm_id: int,
@@ -99,11 +451,12 @@ async def update_vm(
         raise HTTPException(status_code=403, detail="Not authorized to modify this VM")
     
     # Update VM in Proxmox
-    proxmox = ProxmoxService()
     try:
+        proxmox = await ProxmoxService.connect(vm.cluster_id)
         await proxmox.update_vm(
             vm.proxmox_id,
-            vm_data.dict(exclude_unset=True)
+            vm_data.dict(exclude_unset=True),
+            vm.vm_type
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update VM in Proxmox: {str(e)}")
@@ -111,6 +464,7 @@ async def update_vm(
     # Update database record
     for key, value in vm_data.dict(exclude_unset=True).items():
         setattr(vm, key, value)
+    record_event(db, vm, UsageEventType.RESIZED)
     
     db.commit()
     db.refresh(vm)
@@ -131,9 +485,9 @@ async def vm_action(
     if current_user.role != UserRole.ADMIN and vm.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to perform actions on this VM")
     
-    proxmox = ProxmoxService()
     try:
-        await proxmox.vm_action(vm.proxmox_id, action.action)
+        proxmox = await ProxmoxService.connect(vm.cluster_id)
+        await proxmox.vm_action(vm.proxmox_id, action.action, vm.vm_type)
         # Update VM status based on action
         status_map = {
             "start": VMStatus.RUNNING,
@@ -142,6 +496,8 @@ async def vm_action(
             "suspend": VMStatus.SUSPENDED
         }
         vm.status = status_map.get(action.action, vm.status)
+        if action.action in ACTION_EVENTS:
+            record_event(db, vm, ACTION_EVENTS[action.action])
         db.commit()
         db.refresh(vm)
     except Exception as e:
@@ -164,14 +520,91 @@ async def delete_vm(
         raise HTTPException(status_code=403, detail="Not authorized to delete this VM")
     
     # Delete VM from Proxmox
-    proxmox = ProxmoxService()
     try:
-        await proxmox.delete_vm(vm.proxmox_id)
+        proxmox = await ProxmoxService.connect(vm.cluster_id)
+        await proxmox.delete_vm(vm.proxmox_id, vm.vm_type)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete VM from Proxmox: {str(e)}")
     
+    await console_broker.expire_vm(vm.id)
+    record_event(db, vm, UsageEventType.DELETED)
+
     # Delete from database
     db.delete(vm)
     db.commit()
     
-    return {"detail": "VM deleted successfully"}
\ No newline at end of file
+    return {"detail": "VM deleted successfully"}
+
+def _get_accessible_vm(vm_id: int, current_user: User, db: Session) -> VirtualMachine:
+    vm = db.query(VirtualMachine).filter(VirtualMachine.id == vm_id).first()
+    if not vm:
+        raise HTTPException(status_code=404, detail="VM not found")
+    
+    if current_user.role != UserRole.ADMIN and current_user.id not in (vm.owner_id, vm.provisioned_by):
+        raise HTTPException(status_code=403, detail="Not authorized to access this VM")
+    return vm
+
+@router.get("/{vm_id}/snapshots", response_model=List[SnapshotResponse])
+async def list_snapshots(
+    vm_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """List snapshots of a VM, oldest first."""
+    vm = _get_accessible_vm(vm_id, current_user, db)
+    
+    loop = asyncio.get_running_loop()
+    try:
+        proxmox = await ProxmoxService.connect(vm.cluster_id)
+        return await loop.run_in_executor(None, proxmox.list_snapshots, vm.proxmox_id, vm.vm_type)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/{vm_id}/snapshots", response_model=List[SnapshotResponse])
+async def create_snapshot(
+    vm_id: int,
+    snapshot: SnapshotCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Take a snapshot of a VM and return its snapshot list.
+
+    Snapshots taken by someone other than the owner, e.g. a teacher's
+    checkpoint, are pinned so retention pruning keeps them.
+    """
+    vm = _get_accessible_vm(vm_id, current_user, db)
+    
+    loop = asyncio.get_running_loop()
+    try:
+        proxmox = await ProxmoxService.connect(vm.cluster_id)
+        await proxmox.create_snapshot(vm.proxmox_id, vm.vm_type, snapshot.name, snapshot.description)
+        snapshots = await loop.run_in_executor(None, proxmox.list_snapshots, vm.proxmox_id, vm.vm_type)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if current_user.id != vm.owner_id:
+        _pin_snapshots(db, [vm.id], snapshot.name, current_user)
+        db.commit()
+    return snapshots
+
+@router.post("/{vm_id}/snapshots/{name}/rollback", response_model=VMResponse)
+async def rollback_snapshot(
+    vm_id: int,
+    name: str,
+    rollback: SnapshotRollback = SnapshotRollback(),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Roll a VM back to one of its snapshots."""
+    vm = _get_accessible_vm(vm_id, current_user, db)
+    
+    try:
+        proxmox = await ProxmoxService.connect(vm.cluster_id)
+        await proxmox.rollback_snapshot(vm.proxmox_id, vm.vm_type, name, rollback.start)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    vm.status = VMStatus.RUNNING if rollback.start else VMStatus.STOPPED
+    record_event(db, vm, UsageEventType.STARTED if rollback.start else UsageEventType.STOPPED)
+    db.commit()
+    db.refresh(vm)
+    return vm
\ No newline at end of file
@@ -0,0 +1,18 @@
+from pydantic import BaseModel
+from typing import Optional, List
+
+class NodeSummary(BaseModel):
+    node: str
+    status: str
+    cpu: Optional[float] = None
+    maxcpu: Optional[int] = None
+    mem: Optional[int] = None
+    maxmem: Optional[int] = None
+
+class ClusterSummary(BaseModel):
+    id: str
+    is_default: bool
+    reachable: bool
+    error: Optional[str] = None
+    guests: int = 0
+    nodes: List[NodeSummary] = []
@@ -0,0 +1,15 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+
+class ConsoleOpen(BaseModel):
+    protocol: Optional[str] = Field(None, description="Console protocol: rdp, ssh or vnc; defaults by VM type")
+
+class ConsoleSession(BaseModel):
+    session_token: str
+    expires_at: int
+    vm_id: int
+    protocol: str
+    connection_id: str
+    client_identifier: str
+    guacamole_url: str
+    guacamole_token: str
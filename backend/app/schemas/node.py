@@ -0,0 +1,33 @@
+from pydantic import BaseModel, Field
+from typing import Optional, List
+
+class NodeDrainRequest(BaseModel):
+    cluster_id: Optional[str] = None
+    targets: Optional[List[str]] = Field(None, description="Allowed destination nodes; defaults to all other online nodes")
+    max_parallel_per_source: int = Field(ge=1, default=2)
+    max_parallel_per_target: int = Field(ge=1, default=1)
+    include_stopped: bool = True
+    with_local_disks: bool = False
+    memory_headroom: float = Field(ge=0, lt=1, default=0.1, description="Fraction of each target's memory kept free")
+    dry_run: bool = Field(False, description="Only return the migration plan")
+
+class DrainMove(BaseModel):
+    vmid: int
+    name: Optional[str] = None
+    type: str
+    running: bool
+    memory: int
+    target: Optional[str] = None
+    status: str
+    upid: Optional[str] = None
+    error: Optional[str] = None
+
+class DrainJobResponse(BaseModel):
+    id: str
+    cluster_id: str
+    node: str
+    status: str
+    error: Optional[str] = None
+    started_at: float
+    finished_at: Optional[float] = None
+    moves: List[DrainMove]
@@ -0,0 +1,8 @@
+from pydantic import BaseModel
+from typing import Optional, Union
+
+class UsageReportRow(BaseModel):
+    key: Optional[Union[int, str]] = None
+    running_hours: float
+    core_hours: float
+    gb_hours: float
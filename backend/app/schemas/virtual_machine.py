@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from ..models.virtual_machine import VMType, VMStatus
 
 class VMBase(BaseModel):
@@ -13,6 +13,8 @@ class VMBase(BaseModel):
 
 class VMCreate(VMBase):
     proxmox_node: str
+    cluster_id: Optional[str] = None
+    course: Optional[str] = None
     owner_id: Optional[int] = None
 
 class VMUpdate(BaseModel):
@@ -22,11 +24,14 @@ class VMUpdate(BaseModel):
     disk_size: Optional[int] = Field(ge=5, default=None)
     rdp_enabled: Optional[bool] = None
     ssh_enabled: Optional[bool] = None
+    course: Optional[str] = None
 
 class VMResponse(VMBase):
     id: int
+    cluster_id: str
     proxmox_id: int
     proxmox_node: str
+    course: Optional[str] = None
     status: VMStatus
     ip_address: Optional[str]
     mac_address: Optional[str]
@@ -43,4 +48,68 @@ class VMResponse(VMBase):
         from_attributes = True
 
 class VMAction(BaseModel):
-    action: str = Field(..., description="Action to perform on VM: start, stop, restart, suspend")
\ No newline at end of file
+    action: str = Field(..., description="Action to perform on VM: start, stop, restart, suspend")
+
+class VMBatchCreate(BaseModel):
+    name_prefix: str = Field(..., description="Each VM is named <name_prefix>-<owner username>")
+    vm_type: VMType
+    cpu_cores: int = Field(ge=1, default=1)
+    memory_mb: int = Field(ge=512, default=1024)
+    disk_size: int = Field(ge=5, default=10)
+    rdp_enabled: bool = True
+    ssh_enabled: bool = True
+    template: Optional[str] = Field(None, description="KVM template VM ID to clone, or LXC ostemplate volume")
+    owner_ids: List[int] = Field(..., min_items=1)
+    course: Optional[str] = None
+    cluster_id: Optional[str] = None
+    nodes: Optional[List[str]] = Field(None, description="Nodes to spread VMs over; defaults to all online nodes")
+    per_node_limit: int = Field(ge=1, default=4)
+    rollback_on_failure: bool = False
+
+class VMBulkAction(VMAction):
+    vm_ids: List[int] = Field(..., min_items=1)
+    per_node_limit: int = Field(ge=1, default=4)
+
+class VMBulkActionItem(BaseModel):
+    vm_id: int
+    cluster_id: str
+    proxmox_id: int
+    ok: bool
+    error: Optional[str] = None
+
+class VMBatchItem(BaseModel):
+    index: int
+    owner_id: int
+    name: str
+    proxmox_id: int
+    proxmox_node: str
+    status: str
+    error: Optional[str] = None
+    vm_id: Optional[int] = None
+
+class VMBatchResponse(BaseModel):
+    total: int
+    created: int
+    failed: int
+    items: List[VMBatchItem]
+
+class SnapshotCreate(BaseModel):
+    name: str = Field(..., min_length=2, max_length=40, description="Must start with a letter")
+    description: str = ""
+
+class SnapshotRollback(BaseModel):
+    start: bool = Field(False, description="Start the VM after rolling back")
+
+class SnapshotResponse(BaseModel):
+    name: str
+    description: Optional[str] = None
+    snaptime: Optional[int] = None
+    parent: Optional[str] = None
+
+class VMBulkSnapshot(BaseModel):
+    snapshot: str = Field(..., min_length=2, max_length=40)
+    vm_ids: Optional[List[int]] = None
+    course: Optional[str] = Field(None, description="Select all VMs of a course instead of listing vm_ids")
+    description: str = ""
+    start: bool = Field(False, description="Rollback only: start the VMs afterwards")
+    per_node_limit: int = Field(ge=1, default=4)
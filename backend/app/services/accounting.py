@@ -0,0 +1,357 @@
+import asyncio
+import os
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal
+from ..models.usage import UsageDaily, UsageEvent, UsageEventType, UsageState
+from ..models.virtual_machine import VirtualMachine, VMStatus
+from .task_tailer import task_tailer
+
+ACCOUNTING_CHECKPOINT_INTERVAL = int(os.getenv("ACCOUNTING_CHECKPOINT_INTERVAL_SECONDS", "300"))
+
+# VM actions and Proxmox task actions -> accounting event
+ACTION_EVENTS = {
+    "start": UsageEventType.STARTED,
+    "restart": UsageEventType.STARTED,
+    "resume": UsageEventType.STARTED,
+    "reboot": UsageEventType.STARTED,
+    "stop": UsageEventType.STOPPED,
+    "shutdown": UsageEventType.STOPPED,
+    "suspend": UsageEventType.STOPPED,
+    "pause": UsageEventType.STOPPED,
+}
+
+REPORT_GROUPS = {
+    "user": UsageDaily.owner_id,
+    "course": UsageDaily.course,
+    "vm": UsageDaily.vm_id,
+}
+
+
+def _upsert(db: Session, model: Any, rows: List[Dict[str, Any]], add: Sequence[str] = ()) -> None:
+    """Insert ``rows``, resolving unique key conflicts in the database.
+
+    On a conflict the ``add`` columns of the new row are added to the
+    existing one; without ``add`` the existing row is kept as it is. Used
+    where workers may insert the same row concurrently, which would
+    otherwise fail one of them with an ``IntegrityError``.
+    """
+    if db.get_bind().dialect.name == "mysql":
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        stmt = dialect_insert(model)
+        updates = {column: getattr(model, column) + stmt.inserted[column] for column in add}
+        # Assigning the key to itself is MySQL's way of doing nothing
+        key = model.__table__.primary_key.columns.values()[0].name
+        stmt = stmt.on_duplicate_key_update(updates or {key: getattr(model, key)})
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(model)
+        if add:
+            stmt = stmt.on_conflict_do_update(set_={
+                column: getattr(model, column) + stmt.excluded[column] for column in add
+            })
+        else:
+            stmt = stmt.on_conflict_do_nothing()
+    db.execute(stmt, rows)
+
+
+def _accrue(db: Session, state: UsageState, until: datetime) -> None:
+    """Add the usage of ``state`` between its cursor and ``until`` to the daily rollups.
+
+    ``state`` must be locked (see ``_lock_states``) so no other worker
+    accrues the same interval.
+    """
+    start = state.accounted_until
+    if state.running and until > start:
+        rows = []
+        while start < until:
+            day_end = datetime.combine(start.date() + timedelta(days=1), time.min)
+            end = min(until, day_end)
+            seconds = int((end - start).total_seconds())
+            if seconds:
+                rows.append({
+                    "day": start.date(),
+                    "vm_id": state.vm_id,
+                    "owner_id": state.owner_id,
+                    "course": state.course,
+                    "running_seconds": seconds,
+                    "core_seconds": seconds * state.cpu_cores,
+                    "mb_seconds": seconds * state.memory_mb,
+                })
+            start = end
+        if rows:
+            _upsert(db, UsageDaily, rows, add=("running_seconds", "core_seconds", "mb_seconds"))
+    state.accounted_until = max(until, state.accounted_until)
+
+
+def _lock_states(db: Session, vms: List[VirtualMachine], at: datetime) -> Dict[int, UsageState]:
+    """Lock the accounting cursors of ``vms``, creating missing ones; keyed by VM id.
+
+    New cursors start at ``at``, not running. The rows stay locked
+    (``SELECT ... FOR UPDATE``) until the caller commits, so the checkpoint
+    and request handlers in other workers never roll up the same interval
+    twice.
+    """
+    _upsert(db, UsageState, [
+        {
+            "vm_id": vm.id,
+            "owner_id": vm.owner_id,
+            "course": vm.course,
+            "running": False,
+            "cpu_cores": vm.cpu_cores or 1,
+            "memory_mb": vm.memory_mb or 0,
+            "accounted_until": at,
+        }
+        for vm in vms
+    ])
+    return {
+        state.vm_id: state
+        for state in db.query(UsageState).filter(
+            UsageState.vm_id.in_([vm.id for vm in vms])
+        ).order_by(UsageState.vm_id).with_for_update()
+    }
+
+
+def _transition(
+    db: Session,
+    vm: VirtualMachine,
+    event: UsageEventType,
+    at: datetime,
+    state: UsageState
+) -> Optional[Dict[str, Any]]:
+    """Move the locked accounting cursor of ``vm``.
+
+    Returns the ``usage_events`` row to write, or ``None`` when the
+    transition changes nothing.
+    """
+    if event == UsageEventType.STARTED and state.running:
+        return None
+    if event == UsageEventType.STOPPED and not state.running:
+        return None
+    if event == UsageEventType.RESIZED and (state.cpu_cores, state.memory_mb) == (vm.cpu_cores, vm.memory_mb):
+        return None
+    _accrue(db, state, at)
+
+    state.owner_id = vm.owner_id
+    state.course = vm.course
+    state.cpu_cores = vm.cpu_cores or 1
+    state.memory_mb = vm.memory_mb or 0
+    if event == UsageEventType.STARTED:
+        state.running = True
+    elif event in (UsageEventType.STOPPED, UsageEventType.DELETED):
+        state.running = False
+
+    return {
+        "vm_id": vm.id,
+        "owner_id": vm.owner_id,
+        "course": vm.course,
+        "event": event,
+        "cpu_cores": state.cpu_cores,
+        "memory_mb": state.memory_mb,
+        "occurred_at": at,
+    }
+
+
+def record_event(
+    db: Session,
+    vm: VirtualMachine,
+    event: UsageEventType,
+    at: Optional[datetime] = None
+) -> bool:
+    """Record a VM state transition and roll its usage up to now.
+
+    Runs inside the caller's session so the event commits together with the
+    VM change. Transitions that don't change anything (starting a running
+    VM, e.g. when the task tailer reports an action this API already
+    recorded) are ignored. Returns whether an event was written.
+    """
+    return record_events(db, [vm], event, at) == 1
+
+
+def record_events(
+    db: Session,
+    vms: Iterable[VirtualMachine],
+    event: UsageEventType,
+    at: Optional[datetime] = None
+) -> int:
+    """Record the same transition for many VMs; returns how many were written.
+
+    Locks every cursor with one query and writes the events with one
+    insert, rather than a query and a flush per VM.
+    """
+    at = at or datetime.utcnow()
+    vms = list(vms)
+    if not vms:
+        return 0
+    states = _lock_states(db, vms, at)
+    rows = [
+        row for row in (_transition(db, vm, event, at, states[vm.id]) for vm in vms)
+        if row is not None
+    ]
+    if rows:
+        db.execute(insert(UsageEvent), rows)
+    return len(rows)
+
+
+def seed_states(db: Session, at: datetime) -> int:
+    """Create the accounting cursor of every VM that has none yet.
+
+    VMs that were already running before accounting was deployed (or that
+    never changed state through this API since) are counted from ``at``,
+    using ``VirtualMachine.status``. Returns the number of VMs seeded.
+    """
+    vms = db.query(VirtualMachine).outerjoin(
+        UsageState, UsageState.vm_id == VirtualMachine.id
+    ).filter(UsageState.vm_id.is_(None)).all()
+    if vms:
+        # A request may create one of these cursors meanwhile; keep whichever came first
+        _upsert(db, UsageState, [
+            {
+                "vm_id": vm.id,
+                "owner_id": vm.owner_id,
+                "course": vm.course,
+                "running": vm.status == VMStatus.RUNNING,
+                "cpu_cores": vm.cpu_cores or 1,
+                "memory_mb": vm.memory_mb or 0,
+                "accounted_until": at,
+            }
+            for vm in vms
+        ])
+    return len(vms)
+
+
+def checkpoint(db: Session, until: Optional[datetime] = None) -> int:
+    """Roll up usage of all running VMs to ``until`` so today's totals stay current."""
+    until = until or datetime.utcnow()
+    seed_states(db, until)
+    states = db.query(UsageState).filter(
+        UsageState.running.is_(True)
+    ).order_by(UsageState.vm_id).with_for_update().all()
+    for state in states:
+        _accrue(db, state, until)
+    db.commit()
+    return len(states)
+
+
+def usage_report(
+    db: Session,
+    start: date,
+    end: date,
+    group_by: str = "user",
+    owner_id: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Aggregate the daily rollups between ``start`` and ``end`` (inclusive)."""
+    key = REPORT_GROUPS[group_by]
+    query = db.query(
+        key.label("key"),
+        func.sum(UsageDaily.running_seconds).label("running_seconds"),
+        func.sum(UsageDaily.core_seconds).label("core_seconds"),
+        func.sum(UsageDaily.mb_seconds).label("mb_seconds")
+    ).filter(UsageDaily.day >= start, UsageDaily.day <= end)
+    if owner_id is not None:
+        query = query.filter(UsageDaily.owner_id == owner_id)
+    return [
+        {
+            "key": row.key,
+            "running_hours": (row.running_seconds or 0) / 3600,
+            "core_hours": (row.core_seconds or 0) / 3600,
+            "gb_hours": (row.mb_seconds or 0) / 1024 / 3600,
+        }
+        for row in query.group_by(key).order_by(key).all()
+    ]
+
+
+def iter_usage_rows(
+    db: Session,
+    start: date,
+    end: date,
+    owner_id: Optional[int] = None,
+    batch_size: int = 1000
+) -> Iterator[UsageDaily]:
+    """Stream daily rollup rows in batches without loading them all at once."""
+    query = db.query(UsageDaily).filter(UsageDaily.day >= start, UsageDaily.day <= end)
+    if owner_id is not None:
+        query = query.filter(UsageDaily.owner_id == owner_id)
+    return query.order_by(UsageDaily.day, UsageDaily.vm_id).yield_per(batch_size)
+
+
+class UsageAccountant:
+    """Background side of accounting.
+
+    Records state changes the task tailer sees for VMs that were started or
+    stopped outside this API, and periodically rolls up running VMs,
+    starting with a pass at startup that seeds VMs without a cursor.
+    """
+
+    def __init__(self):
+        self._tasks: List[asyncio.Task] = []
+        self._queue: Optional[asyncio.Queue] = None
+
+    def _record_task_events(self, events: List[Dict[str, Any]]) -> None:
+        db = SessionLocal()
+        try:
+            for event in events:
+                usage_event = ACTION_EVENTS.get(event["action"])
+                if usage_event is None or not event["ok"]:
+                    continue
+                vm = db.query(VirtualMachine).filter(
+                    VirtualMachine.cluster_id == event["cluster_id"],
+                    VirtualMachine.proxmox_id == event["vmid"]
+                ).first()
+                if vm:
+                    record_event(db, vm, usage_event, datetime.utcfromtimestamp(event["endtime"]))
+            db.commit()
+        finally:
+            db.close()
+
+    async def _consume(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            events = [await self._queue.get()]
+            while not self._queue.empty():
+                events.append(self._queue.get_nowait())
+            try:
+                await loop.run_in_executor(None, self._record_task_events, events)
+            except Exception:
+                pass  # Keep consuming; the periodic checkpoint still accrues usage
+
+    def _checkpoint(self) -> None:
+        db = SessionLocal()
+        try:
+            checkpoint(db)
+        finally:
+            db.close()
+
+    async def _checkpoint_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            # The first pass runs at startup, so VMs without a cursor start accruing right away
+            try:
+                await loop.run_in_executor(None, self._checkpoint)
+            except Exception:
+                pass  # Try again on the next pass
+            await asyncio.sleep(ACCOUNTING_CHECKPOINT_INTERVAL)
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        loop = asyncio.get_running_loop()
+        self._queue = task_tailer.subscribe()
+        self._tasks = [loop.create_task(self._consume())]
+        if ACCOUNTING_CHECKPOINT_INTERVAL > 0:
+            self._tasks.append(loop.create_task(self._checkpoint_loop()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self._queue is not None:
+            task_tailer.unsubscribe(self._queue)
+            self._queue = None
+
+
+usage_accountant = UsageAccountant()
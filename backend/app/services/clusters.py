@@ -0,0 +1,150 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from proxmoxer import ProxmoxAPI
+
+DEFAULT_CLUSTER = "default"
+VM_NODE_CACHE_TTL = int(os.getenv("VM_NODE_CACHE_TTL_SECONDS", "60"))
+# Per request, including the login, so an unreachable cluster fails fast
+PROXMOX_TIMEOUT = int(os.getenv("PROXMOX_TIMEOUT_SECONDS", "5"))
+
+
+class VMNodeCache:
+    """Cache of which node each guest of one cluster lives on.
+
+    Entries expire after ``VM_NODE_CACHE_TTL`` seconds and are dropped early
+    by the task tailer, which runs in every worker, when a guest is
+    migrated or destroyed.
+    """
+
+    def __init__(self, ttl: int = VM_NODE_CACHE_TTL):
+        self.ttl = ttl
+        self._nodes: Dict[int, str] = {}
+        self._expires = 0.0
+
+    def get(self, vmid: int) -> Optional[str]:
+        if time.monotonic() >= self._expires:
+            self._nodes.clear()
+        return self._nodes.get(vmid)
+
+    def refresh(self, nodes: Dict[int, str]) -> None:
+        self._nodes = dict(nodes)
+        self._expires = time.monotonic() + self.ttl
+
+    def set(self, vmid: int, node: str) -> None:
+        self._nodes[vmid] = node
+
+    def invalidate(self, vmid: Optional[int] = None) -> None:
+        if vmid is None:
+            self._nodes.clear()
+        else:
+            self._nodes.pop(vmid, None)
+
+
+def _env_prefix(cluster_id: str) -> str:
+    return "PROXMOX_" + cluster_id.upper().replace("-", "_") + "_"
+
+
+class ClusterRegistry:
+    """Known Proxmox clusters and one shared, lazily created client per cluster.
+
+    With ``PROXMOX_CLUSTERS`` unset there is a single cluster called
+    ``default`` configured by ``PROXMOX_HOST``/``PROXMOX_USER``/
+    ``PROXMOX_PASSWORD``. Otherwise ``PROXMOX_CLUSTERS`` is a comma separated
+    list of cluster ids, each configured by ``PROXMOX_<ID>_HOST``,
+    ``PROXMOX_<ID>_USER`` and ``PROXMOX_<ID>_PASSWORD``, and
+    ``PROXMOX_DEFAULT_CLUSTER`` (or the first id) is used when a request
+    does not name a cluster.
+    """
+
+    def __init__(self):
+        self.configs = self._load()
+        self.default = os.getenv("PROXMOX_DEFAULT_CLUSTER") or next(iter(self.configs))
+        self._clients: Dict[str, ProxmoxAPI] = {}
+        self._node_caches: Dict[str, VMNodeCache] = {
+            cluster_id: VMNodeCache() for cluster_id in self.configs
+        }
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load() -> Dict[str, Dict[str, str]]:
+        cluster_ids = [c.strip() for c in os.getenv("PROXMOX_CLUSTERS", "").split(",") if c.strip()]
+        if not cluster_ids:
+            return {DEFAULT_CLUSTER: {
+                "host": os.getenv("PROXMOX_HOST", "localhost"),
+                "user": os.getenv("PROXMOX_USER", "root@pam"),
+                "password": os.getenv("PROXMOX_PASSWORD", ""),
+            }}
+        return {
+            cluster_id: {
+                "host": os.getenv(_env_prefix(cluster_id) + "HOST", "localhost"),
+                "user": os.getenv(_env_prefix(cluster_id) + "USER", "root@pam"),
+                "password": os.getenv(_env_prefix(cluster_id) + "PASSWORD", ""),
+            }
+            for cluster_id in cluster_ids
+        }
+
+    @property
+    def ids(self) -> List[str]:
+        return list(self.configs)
+
+    def resolve(self, cluster_id: Optional[str] = None) -> str:
+        """Return a known cluster id, substituting the default for ``None``."""
+        cluster_id = cluster_id or self.default
+        if cluster_id not in self.configs:
+            raise Exception(f"Unknown cluster: {cluster_id}")
+        return cluster_id
+
+    def client(self, cluster_id: Optional[str] = None) -> ProxmoxAPI:
+        """Get the shared client of a cluster, logging in on first use.
+
+        The login is a blocking HTTP request; from async code go through
+        ``ProxmoxService.connect`` so it runs in the executor.
+        """
+        cluster_id = self.resolve(cluster_id)
+        client = self._clients.get(cluster_id)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(cluster_id)
+                if client is None:
+                    config = self.configs[cluster_id]
+                    client = ProxmoxAPI(
+                        host=config["host"],
+                        user=config["user"],
+                        password=config["password"],
+                        verify_ssl=False,
+                        timeout=PROXMOX_TIMEOUT
+                    )
+                    self._clients[cluster_id] = client
+        return client
+
+    def reset(self, cluster_id: str) -> None:
+        """Drop a cluster's client so the next use logs in again."""
+        with self._lock:
+            self._clients.pop(cluster_id, None)
+
+    def node_cache(self, cluster_id: Optional[str] = None) -> VMNodeCache:
+        return self._node_caches[self.resolve(cluster_id)]
+
+    async def fan_out(
+        self,
+        func: Callable[[str], Awaitable[Any]],
+        cluster_ids: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Run ``func(cluster_id)`` for every cluster concurrently.
+
+        Total latency is that of the slowest cluster. A failing cluster does
+        not affect the others; its entry in the result is the exception.
+        """
+        cluster_ids = cluster_ids if cluster_ids is not None else self.ids
+        results = await asyncio.gather(
+            *(func(cluster_id) for cluster_id in cluster_ids),
+            return_exceptions=True
+        )
+        return dict(zip(cluster_ids, results))
+
+
+cluster_registry = ClusterRegistry()
@@ -0,0 +1,157 @@
+import asyncio
+import os
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..database import SessionLocal
+from ..models.virtual_machine import VirtualMachine, VMType
+from .clusters import cluster_registry
+from .proxmox import ProxmoxService
+
+DISCOVERY_INTERVAL = int(os.getenv("DISCOVERY_INTERVAL_SECONDS", "300"))
+DISCOVERY_NODE_CONCURRENCY = int(os.getenv("DISCOVERY_NODE_CONCURRENCY", "8"))
+# Optional dnsmasq lease file used for guests without a guest agent
+DHCP_LEASES_FILE = os.getenv("DHCP_LEASES_FILE")
+
+
+def read_dhcp_leases(path: Optional[str] = DHCP_LEASES_FILE) -> Dict[str, str]:
+    """Map MAC to IPv4 from a dnsmasq lease file (``expiry mac ip host clientid``)."""
+    leases: Dict[str, str] = {}
+    if not path:
+        return leases
+    try:
+        with open(path) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 3 and fields[1].count(":") == 5 and "." in fields[2]:
+                    leases[fields[1].upper()] = fields[2]
+    except OSError:
+        pass
+    return leases
+
+
+class NetworkDiscovery:
+    """Fills in ``ip_address`` and ``mac_address`` of VMs from Proxmox.
+
+    One ``cluster/resources`` call per Proxmox cluster locates every guest;
+    per-guest config and guest agent lookups then run in parallel, bounded
+    per node by ``DISCOVERY_NODE_CONCURRENCY``, with all clusters scanned
+    concurrently. Only rows whose addresses changed are written back, in a
+    single bulk update.
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    async def _lookup(
+        self,
+        proxmox: ProxmoxService,
+        semaphores: Dict[str, asyncio.Semaphore],
+        resource: Dict[str, Any]
+    ) -> Tuple[int, Optional[Dict[str, Optional[str]]]]:
+        loop = asyncio.get_running_loop()
+        async with semaphores[resource['node']]:
+            try:
+                network = await loop.run_in_executor(
+                    None, proxmox.get_guest_network,
+                    resource['node'], resource['vmid'], resource['type'],
+                    resource.get('status') == 'running'
+                )
+            except Exception:
+                return resource['vmid'], None
+        return resource['vmid'], network
+
+    async def discover_cluster(self, cluster_id: str, rows: List[Any]) -> Dict[str, int]:
+        """Scan one cluster's guests and write back changed addresses."""
+        loop = asyncio.get_running_loop()
+        proxmox = await ProxmoxService.connect(cluster_id)
+        guests = await loop.run_in_executor(None, proxmox.get_cluster_guests)
+        leases = await loop.run_in_executor(None, read_dhcp_leases)
+
+        semaphores: Dict[str, asyncio.Semaphore] = defaultdict(
+            lambda: asyncio.Semaphore(DISCOVERY_NODE_CONCURRENCY)
+        )
+        wanted = [
+            guests[row.proxmox_id] for row in rows
+            if row.proxmox_id in guests
+            and guests[row.proxmox_id]['type'] == ('qemu' if row.vm_type == VMType.KVM else 'lxc')
+        ]
+        results = dict(await asyncio.gather(
+            *(self._lookup(proxmox, semaphores, resource) for resource in wanted)
+        ))
+
+        updates: List[Dict[str, Any]] = []
+        for row in rows:
+            network = results.get(row.proxmox_id)
+            if network is None:
+                continue
+            if not network["ip_address"] and network["mac_address"]:
+                network["ip_address"] = leases.get(network["mac_address"])
+            # Keep the last known IP while a guest is stopped
+            ip = network["ip_address"] or row.ip_address
+            mac = network["mac_address"] or row.mac_address
+            if (ip, mac) != (row.ip_address, row.mac_address):
+                updates.append({"id": row.id, "ip_address": ip, "mac_address": mac})
+
+        if updates:
+            db = SessionLocal()
+            try:
+                db.bulk_update_mappings(VirtualMachine, updates)
+                db.commit()
+            finally:
+                db.close()
+
+        return {"scanned": len(results), "updated": len(updates)}
+
+    async def discover(self) -> Dict[str, int]:
+        """Run one discovery pass and return counts of scanned and updated VMs."""
+        db = SessionLocal()
+        try:
+            rows = db.query(
+                VirtualMachine.id,
+                VirtualMachine.cluster_id,
+                VirtualMachine.proxmox_id,
+                VirtualMachine.vm_type,
+                VirtualMachine.ip_address,
+                VirtualMachine.mac_address
+            ).all()
+        finally:
+            db.close()
+
+        by_cluster: Dict[str, List[Any]] = defaultdict(list)
+        for row in rows:
+            by_cluster[row.cluster_id].append(row)
+
+        results = await cluster_registry.fan_out(
+            lambda cluster_id: self.discover_cluster(cluster_id, by_cluster[cluster_id]),
+            [cluster_id for cluster_id in by_cluster if cluster_id in cluster_registry.configs]
+        )
+        totals = {"scanned": 0, "updated": 0, "failed_clusters": 0}
+        for cluster_id, result in results.items():
+            if isinstance(result, Exception):
+                totals["failed_clusters"] += 1
+                cluster_registry.reset(cluster_id)
+                continue
+            totals["scanned"] += result["scanned"]
+            totals["updated"] += result["updated"]
+        return totals
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.discover()
+            except Exception:
+                pass  # Proxmox or the database may be briefly unavailable
+            await asyncio.sleep(DISCOVERY_INTERVAL)
+
+    def start(self) -> None:
+        if self._task is None and DISCOVERY_INTERVAL > 0:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+network_discovery = NetworkDiscovery()
@@ -0,0 +1,325 @@
+import asyncio
+import copy
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal
+from ..models.drain import NodeDrain
+from ..models.virtual_machine import VirtualMachine
+from .proxmox import ProxmoxService
+
+# Finished drain jobs stay visible this long before they are forgotten
+DRAIN_JOB_RETENTION = int(os.getenv("DRAIN_JOB_RETENTION_SECONDS", str(24 * 3600)))
+DRAIN_HEARTBEAT = int(os.getenv("DRAIN_HEARTBEAT_SECONDS", "30"))
+# A job whose worker missed this many heartbeats is considered interrupted
+DRAIN_STALE_AFTER = 4 * DRAIN_HEARTBEAT
+
+ACTIVE_STATUSES = ("planning", "running")
+
+
+def plan_drain(
+    nodes: List[Dict[str, Any]],
+    guests: List[Dict[str, Any]],
+    source: str,
+    targets: Optional[List[str]] = None,
+    memory_headroom: float = 0.1
+) -> List[Dict[str, Any]]:
+    """Assign every guest on ``source`` a destination node by free memory.
+
+    Guests are placed largest first onto the online target with the most
+    free memory, keeping ``memory_headroom`` of each target's memory free.
+    Running guests count with their configured memory, stopped ones count
+    too since they will need it once started. Guests that fit nowhere are
+    returned with ``target`` set to ``None``.
+    """
+    free = {
+        node["node"]: node.get("maxmem", 0) * (1 - memory_headroom) - node.get("mem", 0)
+        for node in nodes
+        if node["node"] != source
+        and node.get("status") == "online"
+        and (not targets or node["node"] in targets)
+    }
+    moves = []
+    for guest in sorted(guests, key=lambda g: g.get("maxmem", 0), reverse=True):
+        needed = guest.get("maxmem", 0)
+        target = max(free, key=free.get) if free else None
+        if target is not None and free[target] >= needed:
+            free[target] -= needed
+        else:
+            target = None
+        moves.append({
+            "vmid": guest["vmid"],
+            "name": guest.get("name"),
+            "type": guest["type"],
+            "running": guest.get("status") == "running",
+            "memory": needed,
+            "target": target,
+            "status": "planned" if target else "unplaced",
+            "upid": None,
+            "error": None,
+        })
+    return moves
+
+
+class DrainConflict(Exception):
+    """The node is already being drained by another job."""
+
+    def __init__(self, job_id: Optional[str]):
+        super().__init__(f"Node is already being drained by job {job_id}")
+        self.job_id = job_id
+
+
+def _epoch(value: Optional[datetime]) -> Optional[float]:
+    return (value - datetime(1970, 1, 1)).total_seconds() if value else None
+
+
+class DrainJob:
+    """Moves all guests off one node with bounded parallelism.
+
+    At most ``max_parallel_per_source`` migrations leave the source node at
+    once and at most ``max_parallel_per_target`` arrive on any one target,
+    which keeps the migration network from saturating. Each move is tracked
+    through its task UPID and ``VirtualMachine.proxmox_node`` is updated as
+    soon as that move finishes.
+
+    The job runs in the worker that started it, which writes its progress
+    to ``node_drains`` on every change (and every ``DRAIN_HEARTBEAT``
+    seconds) so any worker can report on it.
+    """
+
+    def __init__(
+        self,
+        cluster_id: str,
+        node: str,
+        targets: Optional[List[str]] = None,
+        max_parallel_per_source: int = 2,
+        max_parallel_per_target: int = 1,
+        include_stopped: bool = True,
+        with_local_disks: bool = False,
+        memory_headroom: float = 0.1
+    ):
+        self.id = uuid.uuid4().hex
+        self.cluster_id = cluster_id
+        self.node = node
+        self.targets = targets
+        self.max_parallel_per_source = max_parallel_per_source
+        self.max_parallel_per_target = max_parallel_per_target
+        self.include_stopped = include_stopped
+        self.with_local_disks = with_local_disks
+        self.memory_headroom = memory_headroom
+        self.status = "planning"
+        self.error: Optional[str] = None
+        self.moves: List[Dict[str, Any]] = []
+        self.started_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        self._claimed = False
+        self._save_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def active_key(self) -> str:
+        return f"{self.cluster_id}/{self.node}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "cluster_id": self.cluster_id,
+            "node": self.node,
+            "status": self.status,
+            "error": self.error,
+            "started_at": _epoch(self.started_at),
+            "finished_at": _epoch(self.finished_at),
+            "moves": self.moves,
+        }
+
+    def _values(self) -> Dict[str, Any]:
+        return {
+            "status": self.status,
+            "error": self.error,
+            "moves": copy.deepcopy(self.moves),
+            "active_key": self.active_key if self.status in ACTIVE_STATUSES else None,
+            "finished_at": self.finished_at,
+            "heartbeat_at": datetime.utcnow(),
+        }
+
+    def claim(self, db: Session) -> None:
+        """Record the job, raising :class:`DrainConflict` if its node is already being drained."""
+        db.add(NodeDrain(
+            id=self.id,
+            cluster_id=self.cluster_id,
+            node=self.node,
+            started_at=self.started_at,
+            **self._values()
+        ))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            raise DrainConflict(
+                db.query(NodeDrain.id).filter(NodeDrain.active_key == self.active_key).scalar()
+            )
+        self._claimed = True
+
+    def _write(self, values: Dict[str, Any]) -> None:
+        db = SessionLocal()
+        try:
+            db.query(NodeDrain).filter(NodeDrain.id == self.id).update(values, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    async def save(self) -> None:
+        """Write the job's current state; writes happen one at a time, in order."""
+        if not self._claimed:
+            return
+        if self._save_lock is None:
+            self._save_lock = asyncio.Lock()
+        async with self._save_lock:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, self._values())
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(DRAIN_HEARTBEAT)
+            try:
+                await self.save()
+            except Exception:
+                pass  # The database may be briefly unavailable
+
+    async def plan(self, proxmox: ProxmoxService) -> None:
+        loop = asyncio.get_running_loop()
+        nodes, guests = await asyncio.gather(
+            loop.run_in_executor(None, proxmox.get_nodes),
+            loop.run_in_executor(None, proxmox.get_cluster_guests)
+        )
+        on_source = [
+            guest for guest in guests.values()
+            if guest["node"] == self.node
+            and guest.get("template") != 1
+            and (self.include_stopped or guest.get("status") == "running")
+        ]
+        self.moves = plan_drain(nodes, on_source, self.node, self.targets, self.memory_headroom)
+
+    @staticmethod
+    def _record_move(cluster_id: str, vmid: int, target: str) -> None:
+        db = SessionLocal()
+        try:
+            db.query(VirtualMachine).filter(
+                VirtualMachine.cluster_id == cluster_id,
+                VirtualMachine.proxmox_id == vmid
+            ).update({VirtualMachine.proxmox_node: target}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    async def _move(
+        self,
+        proxmox: ProxmoxService,
+        move: Dict[str, Any],
+        source_limit: asyncio.Semaphore,
+        target_limits: Dict[str, asyncio.Semaphore]
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        # Take the target slot first so a move never holds a source slot
+        # while waiting on a busy target that other moves don't need
+        async with target_limits[move["target"]], source_limit:
+            move["status"] = "migrating"
+            try:
+                move["upid"] = await loop.run_in_executor(
+                    None, proxmox.migrate_guest,
+                    self.node, move["vmid"], move["type"], move["target"],
+                    move["running"], self.with_local_disks
+                )
+                await self.save()
+                await proxmox.wait_for_task(self.node, move["upid"], timeout=3600, interval=2)
+                await loop.run_in_executor(
+                    None, self._record_move, self.cluster_id, move["vmid"], move["target"]
+                )
+                proxmox.node_cache.set(move["vmid"], move["target"])
+                move["status"] = "done"
+            except Exception as e:
+                move["status"] = "failed"
+                move["error"] = str(e)
+        try:
+            await self.save()
+        except Exception:
+            pass  # The next save or heartbeat catches up
+
+    async def run(self, dry_run: bool = False) -> None:
+        heartbeat = asyncio.get_running_loop().create_task(self._heartbeat())
+        try:
+            proxmox = await ProxmoxService.connect(self.cluster_id)
+            await self.plan(proxmox)
+            if dry_run:
+                self.status = "planned"
+                return
+
+            self.status = "running"
+            await self.save()
+            source_limit = asyncio.Semaphore(self.max_parallel_per_source)
+            target_limits = {
+                move["target"]: asyncio.Semaphore(self.max_parallel_per_target)
+                for move in self.moves if move["target"]
+            }
+            await asyncio.gather(*(
+                self._move(proxmox, move, source_limit, target_limits)
+                for move in self.moves if move["target"]
+            ))
+            self.status = "completed" if all(m["status"] == "done" for m in self.moves) else "incomplete"
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+        finally:
+            heartbeat.cancel()
+            self.finished_at = datetime.utcnow()
+            drain_jobs.pop(self.id, None)
+            try:
+                await self.save()
+            except Exception:
+                pass  # Left active, the job shows as interrupted once its heartbeat is stale
+
+    def start(self) -> None:
+        drain_jobs[self.id] = self
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+
+# Drain jobs running in this process, by id; node_drains is what requests read
+drain_jobs: Dict[str, DrainJob] = {}
+
+
+def prune_drain_jobs(db: Session, retention: float = DRAIN_JOB_RETENTION) -> None:
+    """Mark jobs whose worker died as interrupted and forget old finished jobs."""
+    now = datetime.utcnow()
+    db.query(NodeDrain).filter(
+        NodeDrain.active_key.isnot(None),
+        NodeDrain.heartbeat_at < now - timedelta(seconds=DRAIN_STALE_AFTER)
+    ).update({
+        NodeDrain.status: "interrupted",
+        NodeDrain.active_key: None,
+        NodeDrain.finished_at: NodeDrain.heartbeat_at
+    }, synchronize_session=False)
+    db.query(NodeDrain).filter(
+        NodeDrain.finished_at < now - timedelta(seconds=retention)
+    ).delete(synchronize_session=False)
+    db.commit()
+
+
+def get_drain_job(db: Session, job_id: str) -> Optional[Dict[str, Any]]:
+    """Load a drain job as reported by the API, whichever worker runs it."""
+    record = db.query(NodeDrain).filter(NodeDrain.id == job_id).first()
+    if record is None:
+        return None
+    return {
+        "id": record.id,
+        "cluster_id": record.cluster_id,
+        "node": record.node,
+        "status": record.status,
+        "error": record.error,
+        "started_at": _epoch(record.started_at),
+        "finished_at": _epoch(record.finished_at),
+        "moves": record.moves,
+    }
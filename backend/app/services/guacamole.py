@@ -0,0 +1,487 @@
+import asyncio
+import base64
+import os
+import secrets
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from jose import JWTError, jwt
+from sqlalchemy.exc import IntegrityError
+
+from ..database import SessionLocal
+from ..models.console import ConsoleConnection, ConsoleSession
+from ..models.virtual_machine import VirtualMachine, VMType
+from ..routers.auth import SECRET_KEY, ALGORITHM
+
+CONSOLE_TOKEN_TTL = int(os.getenv("CONSOLE_TOKEN_TTL_SECONDS", "300"))
+CONSOLE_IDLE_TIMEOUT = int(os.getenv("CONSOLE_IDLE_TIMEOUT_SECONDS", "900"))
+CONSOLE_CLEANUP_INTERVAL = int(os.getenv("CONSOLE_CLEANUP_INTERVAL_SECONDS", "60"))
+
+# Guacamole expires auth tokens after 60 idle minutes; refresh well before that
+GUACAMOLE_TOKEN_TTL = 30 * 60
+
+DEFAULT_PORTS = {"rdp": 3389, "ssh": 22, "vnc": 5900}
+
+# last_seen / last_used of sessions and connections to remove on the next cleanup
+EXPIRED = datetime(1970, 1, 1)
+
+
+class GuacamoleClient:
+    """Minimal client for the Guacamole REST API.
+
+    Reuses one HTTP session and one auth token for the whole process instead
+    of logging in for every request.
+    """
+
+    def __init__(self):
+        self.url = os.getenv("GUACAMOLE_URL", "http://localhost:8080/guacamole").rstrip("/")
+        self.username = os.getenv("GUACAMOLE_USERNAME", "guacadmin")
+        self.password = os.getenv("GUACAMOLE_PASSWORD", "guacadmin")
+        self.session = requests.Session()
+        self._token: Optional[str] = None
+        self._data_source: Optional[str] = None
+        self._token_expires = 0.0
+
+    def _auth(self) -> Tuple[str, str]:
+        """Return a cached ``(auth token, data source)``, logging in when needed."""
+        if self._token is None or time.monotonic() >= self._token_expires:
+            response = self.session.post(
+                f"{self.url}/api/tokens",
+                data={"username": self.username, "password": self.password},
+                timeout=10
+            )
+            response.raise_for_status()
+            body = response.json()
+            self._token = body["authToken"]
+            self._data_source = body["dataSource"]
+            self._token_expires = time.monotonic() + GUACAMOLE_TOKEN_TTL
+        return self._token, self._data_source
+
+    def _request(self, method: str, path: str, **kwargs: Any) -> Any:
+        for attempt in range(2):
+            token, data_source = self._auth()
+            response = self.session.request(
+                method,
+                f"{self.url}/api/session/data/{data_source}{path}",
+                params={"token": token},
+                timeout=10,
+                **kwargs
+            )
+            if response.status_code in (401, 403) and attempt == 0:
+                # Token was revoked or expired server-side; log in again once
+                self._token = None
+                continue
+            response.raise_for_status()
+            return response.json() if response.content else None
+
+    def client_identifier(self, connection_id: str) -> str:
+        """Encode the identifier used by ``#/client/<id>`` URLs and the tunnel."""
+        _, data_source = self._auth()
+        raw = f"{connection_id}\0c\0{data_source}".encode()
+        return base64.b64encode(raw).decode()
+
+    def create_console_user(self, username: str, connection_id: str) -> str:
+        """Create a Guacamole user that may only use one connection and log it in.
+
+        Returns that user's auth token, which is what the browser gets; the
+        broker's own (admin) token never leaves the backend.
+        """
+        password = secrets.token_urlsafe(24)
+        self._request("POST", "/users", json={"username": username, "password": password, "attributes": {}})
+        try:
+            self._request("PATCH", f"/users/{username}/permissions", json=[
+                {"op": "add", "path": f"/connectionPermissions/{connection_id}", "value": "READ"}
+            ])
+            response = self.session.post(
+                f"{self.url}/api/tokens",
+                data={"username": username, "password": password},
+                timeout=10
+            )
+            response.raise_for_status()
+            return response.json()["authToken"]
+        except requests.RequestException:
+            self._request("DELETE", f"/users/{username}")
+            raise
+
+    def delete_console_user(self, username: str, token: Optional[str] = None) -> None:
+        """Revoke a console user's token and delete the user."""
+        if token:
+            try:
+                self.session.delete(f"{self.url}/api/tokens/{token}", timeout=10)
+            except requests.RequestException:
+                pass  # Deleting the user below still locks it out
+        self._request("DELETE", f"/users/{username}")
+
+    def create_connection(self, name: str, protocol: str, parameters: Dict[str, str]) -> str:
+        connection = self._request("POST", "/connections", json={
+            "parentIdentifier": "ROOT",
+            "name": name,
+            "protocol": protocol,
+            "parameters": parameters,
+            "attributes": {}
+        })
+        return connection["identifier"]
+
+    def update_connection(self, connection_id: str, name: str, protocol: str, parameters: Dict[str, str]) -> None:
+        self._request("PUT", f"/connections/{connection_id}", json={
+            "identifier": connection_id,
+            "parentIdentifier": "ROOT",
+            "name": name,
+            "protocol": protocol,
+            "parameters": parameters,
+            "attributes": {}
+        })
+
+    def delete_connection(self, connection_id: str) -> None:
+        self._request("DELETE", f"/connections/{connection_id}")
+
+
+class ConsoleBroker:
+    """Issues console sessions and keeps Guacamole connections warm.
+
+    Connection definitions are cached per VM and protocol, so reconnecting
+    to a console reuses the existing Guacamole connection unless the VM's
+    address or port changed. Every session gets its own Guacamole user with
+    READ permission on that one connection, and the browser only ever sees
+    that user's token. A background loop ends sessions that stopped sending
+    keepalives (deleting their Guacamole users) and deletes Guacamole
+    connections that no session has used for ``CONSOLE_IDLE_TIMEOUT``
+    seconds.
+
+    Sessions and connections live in the database, so any worker can serve
+    any console request; only the worker running the background tasks runs
+    the cleanup loop. Guacamole and database calls run in the default
+    executor.
+    """
+
+    def __init__(self, client: Optional[GuacamoleClient] = None):
+        self.client = client or GuacamoleClient()
+        # One lock per VM and protocol, so consoles of different VMs open in
+        # parallel. Bounded by the number of VMs times two protocols.
+        self._connection_locks: Dict[Tuple[int, str], asyncio.Lock] = {}
+        self._cleanup_task: Optional[asyncio.Task] = None
+
+    def _connection_lock(self, vm_id: int, protocol: str) -> asyncio.Lock:
+        # Created on first use so it binds to the server's event loop
+        lock = self._connection_locks.get((vm_id, protocol))
+        if lock is None:
+            lock = self._connection_locks[(vm_id, protocol)] = asyncio.Lock()
+        return lock
+
+    @staticmethod
+    def select_protocol(vm: VirtualMachine, requested: Optional[str] = None) -> str:
+        """Pick the console protocol, matching the frontend's defaults."""
+        if requested:
+            return requested
+        if vm.vm_type == VMType.KVM and vm.rdp_enabled:
+            return "rdp"
+        if vm.ssh_enabled:
+            return "ssh"
+        return "vnc"
+
+    @staticmethod
+    def connection_parameters(vm: VirtualMachine, protocol: str) -> Dict[str, str]:
+        port = {"rdp": vm.rdp_port, "ssh": vm.ssh_port}.get(protocol)
+        parameters = {
+            "hostname": vm.ip_address,
+            "port": str(port or DEFAULT_PORTS[protocol]),
+        }
+        if protocol == "rdp":
+            parameters["ignore-cert"] = "true"
+            parameters["security"] = "any"
+        return parameters
+
+    @staticmethod
+    def _load_connection(vm_id: int, protocol: str) -> Optional[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            row = db.query(ConsoleConnection).filter(
+                ConsoleConnection.vm_id == vm_id,
+                ConsoleConnection.protocol == protocol
+            ).first()
+            if row is None:
+                return None
+            row.last_used = datetime.utcnow()
+            db.commit()
+            return {"id": row.connection_id, "parameters": row.parameters}
+        finally:
+            db.close()
+
+    @staticmethod
+    def _store_connection(vm_id: int, protocol: str, connection_id: str, parameters: Dict[str, str]) -> str:
+        """Record a connection; returns the id already stored if another worker won the race."""
+        db = SessionLocal()
+        try:
+            row = db.query(ConsoleConnection).filter(
+                ConsoleConnection.vm_id == vm_id,
+                ConsoleConnection.protocol == protocol
+            ).first()
+            if row is None:
+                row = ConsoleConnection(vm_id=vm_id, protocol=protocol)
+                db.add(row)
+            row.connection_id = connection_id
+            row.parameters = parameters
+            row.last_used = datetime.utcnow()
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                return db.query(ConsoleConnection.connection_id).filter(
+                    ConsoleConnection.vm_id == vm_id,
+                    ConsoleConnection.protocol == protocol
+                ).scalar()
+            return connection_id
+        finally:
+            db.close()
+
+    async def _ensure_connection(self, vm: VirtualMachine, protocol: str) -> str:
+        """Return a Guacamole connection id for the VM, creating or updating it only when needed."""
+        parameters = self.connection_parameters(vm, protocol)
+        loop = asyncio.get_running_loop()
+        async with self._connection_lock(vm.id, protocol):
+            cached = await loop.run_in_executor(None, self._load_connection, vm.id, protocol)
+            if cached and cached["parameters"] == parameters:
+                return cached["id"]
+
+            name = f"vm-{vm.id}-{protocol}"
+            if cached:
+                await loop.run_in_executor(
+                    None, self.client.update_connection, cached["id"], name, protocol, parameters
+                )
+                connection_id = cached["id"]
+            else:
+                connection_id = await loop.run_in_executor(
+                    None, self.client.create_connection, name, protocol, parameters
+                )
+            stored = await loop.run_in_executor(
+                None, self._store_connection, vm.id, protocol, connection_id, parameters
+            )
+            if stored != connection_id:
+                # Another worker created one at the same time; keep theirs
+                await loop.run_in_executor(None, self.client.delete_connection, connection_id)
+            return stored
+
+    def _issue_token(self, session_id: str) -> Tuple[str, int]:
+        expires_at = int(time.time()) + CONSOLE_TOKEN_TTL
+        token = jwt.encode({"sid": session_id, "exp": expires_at, "scope": "console"}, SECRET_KEY, algorithm=ALGORITHM)
+        return token, expires_at
+
+    @staticmethod
+    def _session_id(token: str) -> str:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            raise Exception("Invalid or expired console token")
+        if payload.get("scope") != "console" or not payload.get("sid"):
+            raise Exception("Console session not found")
+        return payload["sid"]
+
+    @staticmethod
+    def _session_dict(row: ConsoleSession) -> Dict[str, Any]:
+        return {column.name: getattr(row, column.name) for column in ConsoleSession.__table__.columns}
+
+    @staticmethod
+    def _store_session(session: Dict[str, Any]) -> None:
+        db = SessionLocal()
+        try:
+            db.add(ConsoleSession(**session))
+            db.commit()
+        finally:
+            db.close()
+
+    @classmethod
+    def _touch_session(cls, session_id: str, user_id: int) -> Dict[str, Any]:
+        """Mark a session and its connection as used; returns the session."""
+        db = SessionLocal()
+        try:
+            row = db.query(ConsoleSession).filter(ConsoleSession.id == session_id).first()
+            if row is None or row.user_id != user_id:
+                raise Exception("Console session not found")
+            now = datetime.utcnow()
+            row.last_seen = now
+            db.query(ConsoleConnection).filter(
+                ConsoleConnection.vm_id == row.vm_id,
+                ConsoleConnection.protocol == row.protocol
+            ).update({ConsoleConnection.last_used: now}, synchronize_session=False)
+            session = cls._session_dict(row)
+            db.commit()
+            return session
+        finally:
+            db.close()
+
+    @classmethod
+    def _remove_session(cls, session_id: str, user_id: Optional[int] = None) -> Dict[str, Any]:
+        """Delete a session row (checking its owner if given); returns the session."""
+        db = SessionLocal()
+        try:
+            row = db.query(ConsoleSession).filter(ConsoleSession.id == session_id).first()
+            if row is None or (user_id is not None and row.user_id != user_id):
+                raise Exception("Console session not found")
+            session = cls._session_dict(row)
+            db.delete(row)
+            db.commit()
+            return session
+        finally:
+            db.close()
+
+    async def open_session(self, vm: VirtualMachine, user_id: int, protocol: Optional[str] = None) -> Dict[str, Any]:
+        """Open (or reopen) a console on a VM in a single call."""
+        if not vm.ip_address:
+            raise Exception(f"VM {vm.id} has no known IP address")
+        protocol = self.select_protocol(vm, protocol)
+        if protocol not in DEFAULT_PORTS:
+            raise Exception(f"Unsupported console protocol: {protocol}")
+
+        connection_id = await self._ensure_connection(vm, protocol)
+        session_id = uuid.uuid4().hex
+        guacamole_user = f"console-{session_id}"
+        loop = asyncio.get_running_loop()
+        guacamole_token = await loop.run_in_executor(
+            None, self.client.create_console_user, guacamole_user, connection_id
+        )
+        client_identifier = await loop.run_in_executor(None, self.client.client_identifier, connection_id)
+        session = {
+            "id": session_id,
+            "vm_id": vm.id,
+            "user_id": user_id,
+            "protocol": protocol,
+            "connection_id": connection_id,
+            "client_identifier": client_identifier,
+            "guacamole_user": guacamole_user,
+            "guacamole_token": guacamole_token,
+            "last_seen": datetime.utcnow()
+        }
+        await loop.run_in_executor(None, self._store_session, session)
+        return self._describe(session)
+
+    def _describe(self, session: Dict[str, Any]) -> Dict[str, Any]:
+        token, expires_at = self._issue_token(session["id"])
+        return {
+            "session_token": token,
+            "expires_at": expires_at,
+            "vm_id": session["vm_id"],
+            "protocol": session["protocol"],
+            "connection_id": session["connection_id"],
+            "client_identifier": session["client_identifier"],
+            "guacamole_url": self.client.url,
+            "guacamole_token": session["guacamole_token"]
+        }
+
+    async def keepalive(self, token: str, user_id: int) -> Dict[str, Any]:
+        """Mark a session as active and hand out a fresh short-lived token."""
+        session_id = self._session_id(token)
+        session = await asyncio.get_running_loop().run_in_executor(
+            None, self._touch_session, session_id, user_id
+        )
+        return self._describe(session)
+
+    async def _delete_user(self, session: Dict[str, Any]) -> None:
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.client.delete_console_user, session["guacamole_user"], session["guacamole_token"]
+            )
+        except requests.RequestException:
+            pass  # The user can only reach its own connection, which cleanup deletes
+
+    async def close_session(self, token: str, user_id: int) -> None:
+        session_id = self._session_id(token)
+        session = await asyncio.get_running_loop().run_in_executor(
+            None, self._remove_session, session_id, user_id
+        )
+        await self._delete_user(session)
+
+    @staticmethod
+    def _expire_vm(vm_id: int) -> None:
+        db = SessionLocal()
+        try:
+            db.query(ConsoleSession).filter(ConsoleSession.vm_id == vm_id).update(
+                {ConsoleSession.last_seen: EXPIRED}, synchronize_session=False
+            )
+            db.query(ConsoleConnection).filter(ConsoleConnection.vm_id == vm_id).update(
+                {ConsoleConnection.last_used: EXPIRED}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    async def expire_vm(self, vm_id: int) -> None:
+        """Mark a VM's sessions and connections so the next cleanup removes them."""
+        await asyncio.get_running_loop().run_in_executor(None, self._expire_vm, vm_id)
+
+    @staticmethod
+    def _expired(now: datetime) -> Tuple[List[str], List[Dict[str, Any]]]:
+        """Ids of idle sessions and the idle connections no session uses."""
+        db = SessionLocal()
+        try:
+            idle_before = now - timedelta(seconds=CONSOLE_TOKEN_TTL)
+            sessions: List[str] = []
+            in_use = set()
+            for row in db.query(ConsoleSession.id, ConsoleSession.vm_id, ConsoleSession.protocol, ConsoleSession.last_seen):
+                if row.last_seen < idle_before:
+                    sessions.append(row.id)
+                else:
+                    in_use.add((row.vm_id, row.protocol))
+            connections = [
+                {"vm_id": row.vm_id, "protocol": row.protocol, "id": row.connection_id}
+                for row in db.query(ConsoleConnection).filter(
+                    ConsoleConnection.last_used < now - timedelta(seconds=CONSOLE_IDLE_TIMEOUT)
+                )
+                if (row.vm_id, row.protocol) not in in_use
+            ]
+            return sessions, connections
+        finally:
+            db.close()
+
+    @staticmethod
+    def _remove_connection(connection: Dict[str, Any]) -> None:
+        db = SessionLocal()
+        try:
+            db.query(ConsoleConnection).filter(
+                ConsoleConnection.vm_id == connection["vm_id"],
+                ConsoleConnection.protocol == connection["protocol"],
+                ConsoleConnection.connection_id == connection["id"]
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    async def cleanup(self) -> None:
+        """End idle sessions and delete Guacamole connections nobody uses."""
+        loop = asyncio.get_running_loop()
+        sessions, connections = await loop.run_in_executor(None, self._expired, datetime.utcnow())
+        for session_id in sessions:
+            try:
+                session = await loop.run_in_executor(None, self._remove_session, session_id)
+            except Exception:
+                continue  # Closed meanwhile
+            await self._delete_user(session)
+
+        for connection in connections:
+            try:
+                await loop.run_in_executor(None, self.client.delete_connection, connection["id"])
+            except requests.RequestException:
+                continue  # Retry on the next pass
+            await loop.run_in_executor(None, self._remove_connection, connection)
+
+    async def _cleanup_loop(self) -> None:
+        while True:
+            await asyncio.sleep(CONSOLE_CLEANUP_INTERVAL)
+            try:
+                await self.cleanup()
+            except Exception:
+                pass  # Never let a cleanup failure kill the loop
+
+    def start(self) -> None:
+        if self._cleanup_task is None:
+            self._cleanup_task = asyncio.get_running_loop().create_task(self._cleanup_loop())
+
+    async def stop(self) -> None:
+        if self._cleanup_task is not None:
+            self._cleanup_task.cancel()
+            self._cleanup_task = None
+
+
+console_broker = ConsoleBroker()
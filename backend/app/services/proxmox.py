@@ -1,19 +1,70 @@
-from proxmoxer import ProxmoxAPI
-from typing import Dict, Any, Optional
-import os
-from dotenv import load_dotenv
+from typing import Dict, Any, Optional, List, Callable, Awaitable, Tuple, Collection
+import asyncio
+import random
+import threading
+import time
+from collections import defaultdict
 from ..models.virtual_machine import VMType, VMStatus
+from .clusters import cluster_registry
 
-load_dotenv()
+DEFAULT_LXC_TEMPLATE = "local:vztmpl/ubuntu-20.04-standard_20.04-1_amd64.tar.gz"
+# Attempts to create a guest when its VM ID turns out to be taken already
+VMID_ATTEMPTS = 5
+
+# VM IDs handed out but not created yet, per cluster, so concurrent creates
+# in this process never pick the same ID
+_reserved_vmids: Dict[str, set] = defaultdict(set)
+_reserved_vmids_lock = threading.Lock()
+
+def _parse_mac(net: str) -> Optional[str]:
+    """Extract the MAC from a ``net0`` config string.
+
+    KVM uses ``virtio=AA:BB:...`` (or another model name), LXC ``hwaddr=AA:BB:...``.
+    """
+    for part in net.split(','):
+        key, _, value = part.partition('=')
+        if value.count(':') == 5 and (key == 'hwaddr' or key not in ('bridge', 'name', 'ip', 'gw')):
+            return value.upper()
+    return None
+
+def _is_usable_ipv4(ip: Optional[str]) -> bool:
+    return bool(ip) and '.' in ip and not ip.startswith(('127.', '169.254.'))
+
+def _pick_agent_ipv4(interfaces: List[Dict[str, Any]], mac: Optional[str]) -> Optional[str]:
+    """Pick the IPv4 address from guest agent output, preferring the configured NIC."""
+    candidates = []
+    for interface in interfaces:
+        for address in interface.get('ip-addresses', []):
+            ip = address.get('ip-address')
+            if address.get('ip-address-type') == 'ipv4' and _is_usable_ipv4(ip):
+                matches = mac and (interface.get('hardware-address') or '').upper() == mac
+                candidates.append((not matches, ip))
+    return min(candidates)[1] if candidates else None
+
+def _pick_lxc_ipv4(interfaces: List[Dict[str, Any]], mac: Optional[str]) -> Optional[str]:
+    """Pick the IPv4 address from LXC ``interfaces`` output."""
+    candidates = []
+    for interface in interfaces:
+        ip = (interface.get('inet') or '').split('/')[0]
+        if _is_usable_ipv4(ip):
+            matches = mac and (interface.get('hwaddr') or '').upper() == mac
+            candidates.append((not matches, ip))
+    return min(candidates)[1] if candidates else None
 
 class ProxmoxService:
-    def __init__(self):
-        self.proxmox = ProxmoxAPI(
-            host=os.getenv("PROXMOX_HOST", "localhost"),
-            user=os.getenv("PROXMOX_USER", "root@pam"),
-            password=os.getenv("PROXMOX_PASSWORD", ""),
-            verify_ssl=False
-        )
+    def __init__(self, cluster_id: Optional[str] = None):
+        self.cluster_id = cluster_registry.resolve(cluster_id)
+        self.proxmox = cluster_registry.client(self.cluster_id)
+        self.node_cache = cluster_registry.node_cache(self.cluster_id)
+
+    @classmethod
+    async def connect(cls, cluster_id: Optional[str] = None) -> "ProxmoxService":
+        """Create a service without blocking the event loop.
+
+        The first use of a cluster, and the first after
+        ``cluster_registry.reset``, logs in over HTTP.
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, cls, cluster_id)
 
     async def create_vm(
         self,
@@ -26,20 +77,69 @@ class ProxmoxService:
     ) -> int:
         """Create a new VM or Container in Proxmox."""
         try:
-            if vm_type == VMType.KVM:
-                return await self._create_kvm(name, cpu_cores, memory_mb, disk_size, node)
-            else:
-                return await self._create_lxc(name, cpu_cores, memory_mb, disk_size, node)
+            return await self._build_guest(vm_type, None, name, cpu_cores, memory_mb, disk_size, node)
         except Exception as e:
             raise Exception(f"Failed to create {vm_type.value}: {str(e)}")
 
-    async def _create_kvm(self, name: str, cpu: int, memory: int, disk: int, node: str) -> int:
-        """Create a KVM virtual machine."""
-        next_vmid = self._get_next_vmid()
-        
-        # Create VM
-        self.proxmox.nodes(node).qemu.create(
-            vmid=next_vmid,
+    async def _build_guest(
+        self,
+        vm_type: VMType,
+        vmid: Optional[int],
+        name: str,
+        cpu: int,
+        memory: int,
+        disk: int,
+        node: str,
+        template: Optional[str] = None
+    ) -> int:
+        """Create a guest and wait until Proxmox has built it; returns the VM ID used.
+
+        The create request only starts a task (disk allocation, template
+        extraction or clone), which can still fail. ``vmid`` is handled as
+        by ``_create_with_vmid``.
+        """
+        loop = asyncio.get_running_loop()
+        create = self._create_kvm_with_id if vm_type == VMType.KVM else self._create_lxc_with_id
+        vmid, (task_node, upid) = await loop.run_in_executor(
+            None, self._create_with_vmid, create, vmid, name, cpu, memory, disk, node, template
+        )
+        await self.wait_for_task(task_node, upid)
+        if vm_type == VMType.KVM and template:
+            # A clone starts out with the template's resources
+            await loop.run_in_executor(
+                None, lambda: self.proxmox.nodes(node).qemu(vmid).config.put(cores=cpu, memory=memory)
+            )
+        return vmid
+
+    def _create_kvm_with_id(
+        self,
+        vmid: int,
+        name: str,
+        cpu: int,
+        memory: int,
+        disk: int,
+        node: str,
+        template: Optional[str] = None
+    ) -> Tuple[str, str]:
+        """Start creating a KVM virtual machine under a pre-allocated VM ID.
+
+        When ``template`` is given it is the VM ID of a KVM template which is
+        cloned instead of building the VM from scratch. Returns the node and
+        UPID of the task to wait for.
+        """
+        if template:
+            template_vmid = int(template)
+            template_node = self._get_vm_node(template_vmid) or node
+            upid = self.proxmox.nodes(template_node).qemu(template_vmid).clone.post(
+                newid=vmid,
+                name=name,
+                target=node,
+                full=1
+            )
+            return template_node, upid
+
+        upid = self.proxmox.nodes(node).qemu.create(
+            vmid=vmid,
             name=name,
             cpu=cpu,
             memory=memory,
@@ -47,59 +147,336 @@ class ProxmoxService:
             net0="virtio,bridge=vmbr0",
             ostype="l26",  # Linux 2.6+ kernel
         )
-        
-        return next_vmid
-
-    async def _create_lxc(self, name: str, cpu: int, memory: int, disk: int, node: str) -> int:
-        """Create a Linux Container."""
-        next_vmid = self._get_next_vmid()
-        
-        # Create Container
-        self.proxmox.nodes(node).lxc.create(
-            vmid=next_vmid,
+        return node, upid
+
+    def _create_lxc_with_id(
+        self,
+        vmid: int,
+        name: str,
+        cpu: int,
+        memory: int,
+        disk: int,
+        node: str,
+        template: Optional[str] = None
+    ) -> Tuple[str, str]:
+        """Start creating a Linux Container under a pre-allocated VM ID.
+
+        Returns the node and UPID of the task to wait for.
+        """
+        upid = self.proxmox.nodes(node).lxc.create(
+            vmid=vmid,
             hostname=name,
             cores=cpu,
             memory=memory,
             rootfs=f"local-lvm:{disk}",
             net0="name=eth0,bridge=vmbr0,ip=dhcp",
-            ostemplate="local:vztmpl/ubuntu-20.04-standard_20.04-1_amd64.tar.gz"
+            ostemplate=template or DEFAULT_LXC_TEMPLATE
         )
-        
-        return next_vmid
+        return node, upid
 
     def _get_next_vmid(self) -> int:
         """Get the next available VM ID."""
-        vmid = 100  # Start from 100
-        while True:
-            try:
-                self.proxmox.cluster.resources.get(vmid=vmid)
+        return self._get_next_vmids(1)[0]
+
+    def _get_next_vmids(self, count: int) -> List[int]:
+        """Allocate ``count`` free VM IDs with a single cluster query.
+
+        The IDs are reserved in this process until ``_release_vmids`` is
+        called, so concurrent creates here never get the same ones.
+        """
+        used = {
+            resource['vmid']
+            for resource in self.proxmox.cluster.resources.get(type='vm')
+            if 'vmid' in resource
+        }
+        with _reserved_vmids_lock:
+            reserved = _reserved_vmids[self.cluster_id]
+            vmids = []
+            vmid = 100  # Start from 100
+            while len(vmids) < count:
+                if vmid not in used and vmid not in reserved:
+                    vmids.append(vmid)
                 vmid += 1
-            except:
-                return vmid
+            reserved.update(vmids)
+        return vmids
+
+    def _release_vmids(self, vmids: List[int]) -> None:
+        with _reserved_vmids_lock:
+            _reserved_vmids[self.cluster_id].difference_update(vmids)
+
+    def _create_with_vmid(self, create: Callable[..., Any], vmid: Optional[int], name: str, *args: Any) -> Tuple[int, Any]:
+        """Run ``create(vmid, name, *args)`` and return the VM ID used with its result.
+
+        ``vmid`` must come from ``_get_next_vmids`` (``None`` allocates one).
+        Reservations only cover this process, so another worker or a manual
+        create can still take the ID first; the create is then retried
+        under a fresh ID, picked at random from a window of free IDs that
+        doubles with every attempt so workers racing for the lowest free
+        ID spread out instead of colliding again.
+        """
+        if vmid is None:
+            vmid = self._get_next_vmid()
+        try:
+            for attempt in range(VMID_ATTEMPTS):
+                try:
+                    return vmid, create(vmid, name, *args)
+                except Exception as e:
+                    if 'already exists' not in str(e) or attempt == VMID_ATTEMPTS - 1:
+                        raise
+                    self._release_vmids([vmid])
+                    candidates = self._get_next_vmids(2 ** (attempt + 1))
+                    vmid = random.choice(candidates)
+                    self._release_vmids([c for c in candidates if c != vmid])
+        finally:
+            self._release_vmids([vmid])
+
+    async def wait_for_task(self, node: str, upid: str, timeout: float = 600, interval: float = 1) -> None:
+        """Wait for a Proxmox task to finish, raising if it did not succeed.
+
+        Only the status requests run in the executor; waiting between them
+        does not hold a thread.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            task = await loop.run_in_executor(None, self.proxmox.nodes(node).tasks(upid).status.get)
+            if task.get('status') == 'stopped':
+                if task.get('exitstatus') != 'OK':
+                    raise Exception(f"Task {upid} failed: {task.get('exitstatus')}")
+                return
+            await asyncio.sleep(interval)
+        raise Exception(f"Task {upid} timed out")
+
+    def get_nodes(self) -> List[Dict[str, Any]]:
+        """Get every node of the cluster with its status and capacity."""
+        return self.proxmox.nodes.get()
+
+    def migrate_guest(
+        self,
+        node: str,
+        vmid: int,
+        guest_type: str,
+        target: str,
+        online: bool,
+        with_local_disks: bool = False
+    ) -> str:
+        """Start migrating a guest to ``target`` and return the task UPID.
+
+        Running KVM guests are live-migrated when ``online`` is set; running
+        containers cannot live-migrate and are moved in restart mode.
+        """
+        params: Dict[str, Any] = {"target": target}
+        if guest_type == 'qemu':
+            if online:
+                params["online"] = 1
+            if with_local_disks:
+                params["with-local-disks"] = 1
+        elif online:
+            params["restart"] = 1
+        return getattr(self.proxmox.nodes(node), guest_type)(vmid).migrate.post(**params)
+
+    def _get_online_nodes(self) -> List[str]:
+        """Get the names of all online cluster nodes."""
+        return [
+            node['node']
+            for node in self.proxmox.nodes.get()
+            if node.get('status') == 'online'
+        ]
+
+    async def create_vms_batch(
+        self,
+        items: List[Dict[str, Any]],
+        vm_type: VMType,
+        cpu_cores: int,
+        memory_mb: int,
+        disk_size: int,
+        nodes: Optional[List[str]] = None,
+        template: Optional[str] = None,
+        per_node_limit: int = 4,
+        rollback_on_failure: bool = False,
+        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> List[Dict[str, Any]]:
+        """Create many VMs or Containers with the same spec in one go.
+
+        ``items`` is a list of dicts holding at least a ``name``. All VM IDs
+        are allocated up front (an item whose ID was taken meanwhile retries
+        under a new one), items are spread round-robin over ``nodes``
+        (all online nodes when omitted) and at most ``per_node_limit``
+        creates run concurrently on a node, each until its Proxmox task
+        has finished. Returns one result dict per item
+        with ``vmid``, ``node``, ``status`` (``created``, ``failed`` or
+        ``rolled_back``) and ``error``. Rollback deletes run under the same
+        per-node limits.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            if not nodes:
+                nodes = await loop.run_in_executor(None, self._get_online_nodes)
+            if not nodes:
+                raise Exception("No online nodes available")
+            vmids = await loop.run_in_executor(None, self._get_next_vmids, len(items))
+        except Exception as e:
+            raise Exception(f"Failed to prepare batch of {vm_type.value}: {str(e)}")
+
+        semaphores = {node: asyncio.Semaphore(per_node_limit) for node in nodes}
+        results = [
+            {
+                **item,
+                "index": index,
+                "vmid": vmids[index],
+                "node": nodes[index % len(nodes)],
+                "status": "pending",
+                "error": None
+            }
+            for index, item in enumerate(items)
+        ]
+
+        async def run(result: Dict[str, Any]) -> None:
+            async with semaphores[result["node"]]:
+                try:
+                    result["vmid"] = await self._build_guest(
+                        vm_type, result["vmid"], result["name"],
+                        cpu_cores, memory_mb, disk_size, result["node"], template
+                    )
+                    result["status"] = "created"
+                except Exception as e:
+                    result["status"] = "failed"
+                    result["error"] = str(e)
+            if on_progress:
+                on_progress(result)
 
-    async def update_vm(self, vmid: int, updates: Dict[str, Any]) -> None:
+        async def roll_back(result: Dict[str, Any]) -> None:
+            async with semaphores[result["node"]]:
+                try:
+                    await self.delete_vm(result["vmid"], vm_type, result["node"])
+                    result["status"] = "rolled_back"
+                except Exception as e:
+                    result["error"] = f"Rollback failed: {str(e)}"
+            if on_progress:
+                on_progress(result)
+
+        await asyncio.gather(*(run(result) for result in results))
+
+        if rollback_on_failure and any(r["status"] == "failed" for r in results):
+            await asyncio.gather(*(roll_back(r) for r in results if r["status"] == "created"))
+
+        return results
+
+    async def update_vm(self, vmid: int, updates: Dict[str, Any], vm_type: VMType = VMType.KVM) -> None:
         """Update VM configuration."""
+        config = {}
+        if 'cpu_cores' in updates:
+            config['cores'] = updates['cpu_cores']
+        if 'memory_mb' in updates:
+            config['memory'] = updates['memory_mb']
+        if not config:
+            return
         try:
-            if 'cpu_cores' in updates:
-                self.proxmox.nodes('proxmox').qemu(vmid).config.put(cores=updates['cpu_cores'])
-            if 'memory_mb' in updates:
-                self.proxmox.nodes('proxmox').qemu(vmid).config.put(memory=updates['memory_mb'])
+            await asyncio.get_running_loop().run_in_executor(
+                None, lambda: self._guest(vmid, vm_type)[1].config.put(**config)
+            )
         except Exception as e:
             raise Exception(f"Failed to update VM {vmid}: {str(e)}")
 
-    async def vm_action(self, vmid: int, action: str) -> None:
+    def get_cluster_guests(self) -> Dict[int, Dict[str, Any]]:
+        """Get node, type and status of every guest with one cluster query."""
+        return {
+            resource['vmid']: resource
+            for resource in self.proxmox.cluster.resources.get(type='vm')
+            if resource.get('type') in ('qemu', 'lxc')
+        }
+
+    def get_guest_network(self, node: str, vmid: int, guest_type: str, running: bool) -> Dict[str, Optional[str]]:
+        """Read a guest's MAC from its config and, if running, its IPv4 address.
+
+        KVM addresses come from the QEMU guest agent, containers from the
+        LXC ``interfaces`` endpoint. Missing agents are not an error; the
+        address is just left unknown.
+        """
+        guest = getattr(self.proxmox.nodes(node), guest_type)(vmid)
+        config = guest.config.get()
+        mac = _parse_mac(config.get('net0', ''))
+        ip = None
+
+        if running:
+            try:
+                if guest_type == 'qemu':
+                    interfaces = guest.agent('network-get-interfaces').get().get('result', [])
+                    ip = _pick_agent_ipv4(interfaces, mac)
+                else:
+                    ip = _pick_lxc_ipv4(guest.interfaces.get(), mac)
+            except Exception:
+                pass  # Guest agent not installed or not responding
+
+        return {"mac_address": mac, "ip_address": ip}
+
+    async def vm_action(self, vmid: int, action: str, vm_type: VMType = VMType.KVM) -> None:
         """Perform action on VM."""
+        await asyncio.get_running_loop().run_in_executor(None, self._vm_action, vmid, action, vm_type)
+
+    async def run_bulk(
+        self,
+        vmids: List[int],
+        func: Callable[[int], Any],
+        per_node_limit: int = 4
+    ) -> Dict[int, Optional[str]]:
+        """Call ``func(vmid)`` for many VMs of this cluster in parallel.
+
+        ``func`` is a blocking call run in the default executor. At most
+        ``per_node_limit`` calls run at once on each node. Returns an error
+        message, or ``None`` on success, for every VM.
+        """
+        loop = asyncio.get_running_loop()
+        return await self.gather_bulk(
+            vmids, lambda vmid: loop.run_in_executor(None, func, vmid), per_node_limit
+        )
+
+    async def gather_bulk(
+        self,
+        vmids: List[int],
+        func: Callable[[int], Awaitable[Any]],
+        per_node_limit: int = 4
+    ) -> Dict[int, Optional[str]]:
+        """Like :meth:`run_bulk`, for a coroutine function ``func``."""
+        loop = asyncio.get_running_loop()
+        if vmids:
+            # Warm the node cache with a single cluster scan
+            await loop.run_in_executor(None, self._get_vm_node, vmids[0])
+        semaphores: Dict[str, asyncio.Semaphore] = defaultdict(lambda: asyncio.Semaphore(per_node_limit))
+
+        async def run(vmid: int):
+            async with semaphores[self.node_cache.get(vmid) or ""]:
+                try:
+                    await func(vmid)
+                    return vmid, None
+                except Exception as e:
+                    return vmid, str(e)
+
+        return dict(await asyncio.gather(*(run(vmid) for vmid in vmids)))
+
+    async def vm_action_bulk(
+        self,
+        vm_types: Dict[int, VMType],
+        action: str,
+        per_node_limit: int = 4
+    ) -> Dict[int, Optional[str]]:
+        """Perform one action on many VMs of this cluster in parallel.
+
+        ``vm_types`` maps the VM ID of every guest to its type.
+        """
+        return await self.run_bulk(
+            list(vm_types), lambda vmid: self._vm_action(vmid, action, vm_types[vmid]), per_node_limit
+        )
+
+    def _vm_action(self, vmid: int, action: str, vm_type: VMType = VMType.KVM) -> None:
         try:
-            node = self._get_vm_node(vmid)
-            if not node:
-                raise Exception(f"VM {vmid} not found")
+            _, vm = self._guest(vmid, vm_type)
 
-            vm = self.proxmox.nodes(node).qemu(vmid)
-            
+            # Proxmox calls a restart a reboot, for KVM and containers alike
             actions = {
                 "start": vm.status.start,
                 "stop": vm.status.stop,
-                "restart": vm.status.restart,
+                "restart": vm.status.reboot,
                 "suspend": vm.status.suspend
             }
             
@@ -110,30 +487,127 @@ class ProxmoxService:
         except Exception as e:
             raise Exception(f"Failed to perform action {action} on VM {vmid}: {str(e)}")
 
-    async def delete_vm(self, vmid: int) -> None:
-        """Delete a VM."""
+    async def delete_vm(self, vmid: int, vm_type: VMType = VMType.KVM, node: Optional[str] = None) -> None:
+        """Delete a VM or Container, stopping it first if it is running."""
+        loop = asyncio.get_running_loop()
         try:
-            node = self._get_vm_node(vmid)
+            if node is None:
+                node = await loop.run_in_executor(None, self._get_vm_node, vmid)
             if not node:
                 raise Exception(f"VM {vmid} not found")
 
-            # Stop VM if running
-            try:
-                self.proxmox.nodes(node).qemu(vmid).status.stop.post()
-            except:
-                pass  # Ignore if already stopped
+            guest_type = 'qemu' if vm_type == VMType.KVM else 'lxc'
+            guest = getattr(self.proxmox.nodes(node), guest_type)(vmid)
+
+            # Proxmox refuses to delete a guest that is not stopped
+            status = await loop.run_in_executor(None, guest.status.current.get)
+            if status.get('status') != 'stopped':
+                upid = await loop.run_in_executor(None, guest.status.stop.post)
+                await self.wait_for_task(node, upid)
 
-            # Delete VM
-            self.proxmox.nodes(node).qemu(vmid).delete()
+            await loop.run_in_executor(None, guest.delete)
+            self.node_cache.invalidate(vmid)
         except Exception as e:
             raise Exception(f"Failed to delete VM {vmid}: {str(e)}")
 
     def _get_vm_node(self, vmid: int) -> Optional[str]:
         """Get the node name where a VM is located."""
-        for resource in self.proxmox.cluster.resources.get():
-            if resource['type'] in ['qemu', 'lxc'] and resource['vmid'] == vmid:
-                return resource['node']
-        return None
+        node = self.node_cache.get(vmid)
+        if node is not None:
+            return node
+        # One scan refreshes the location of every guest, not just this one
+        self.node_cache.refresh({
+            guest_vmid: resource['node']
+            for guest_vmid, resource in self.get_cluster_guests().items()
+        })
+        return self.node_cache.get(vmid)
+
+    def _guest(self, vmid: int, vm_type: VMType):
+        node = self._get_vm_node(vmid)
+        if not node:
+            raise Exception(f"VM {vmid} not found")
+        guest_type = 'qemu' if vm_type == VMType.KVM else 'lxc'
+        return node, getattr(self.proxmox.nodes(node), guest_type)(vmid)
+
+    def list_snapshots(self, vmid: int, vm_type: VMType) -> List[Dict[str, Any]]:
+        """List a guest's snapshots, oldest first, without the ``current`` pseudo-entry."""
+        try:
+            _, guest = self._guest(vmid, vm_type)
+            snapshots = [s for s in guest.snapshot.get() if s.get('name') != 'current']
+            return sorted(snapshots, key=lambda s: s.get('snaptime', 0))
+        except Exception as e:
+            raise Exception(f"Failed to list snapshots of VM {vmid}: {str(e)}")
+
+    def _snapshot_task(self, vmid: int, vm_type: VMType, request: Callable[[Any], str]) -> Tuple[str, str]:
+        """Start a snapshot task on a guest and return ``(node, upid)``."""
+        node, guest = self._guest(vmid, vm_type)
+        return node, request(guest)
+
+    async def create_snapshot(self, vmid: int, vm_type: VMType, name: str, description: str = "") -> None:
+        """Take a snapshot and wait for it to finish."""
+        loop = asyncio.get_running_loop()
+        try:
+            node, upid = await loop.run_in_executor(
+                None, self._snapshot_task, vmid, vm_type,
+                lambda guest: guest.snapshot.post(snapname=name, description=description)
+            )
+            await self.wait_for_task(node, upid)
+        except Exception as e:
+            raise Exception(f"Failed to snapshot VM {vmid}: {str(e)}")
+
+    async def rollback_snapshot(self, vmid: int, vm_type: VMType, name: str, start: bool = False) -> None:
+        """Roll a guest back to a snapshot and wait for it to finish."""
+        loop = asyncio.get_running_loop()
+        params = {"start": 1} if start else {}
+        try:
+            node, upid = await loop.run_in_executor(
+                None, self._snapshot_task, vmid, vm_type,
+                lambda guest: guest.snapshot(name).rollback.post(**params)
+            )
+            await self.wait_for_task(node, upid)
+        except Exception as e:
+            raise Exception(f"Failed to roll back VM {vmid} to {name}: {str(e)}")
+
+    async def delete_snapshot(self, vmid: int, vm_type: VMType, name: str) -> None:
+        """Delete a snapshot and wait for it to finish."""
+        loop = asyncio.get_running_loop()
+        try:
+            node, upid = await loop.run_in_executor(
+                None, self._snapshot_task, vmid, vm_type,
+                lambda guest: guest.snapshot(name).delete()
+            )
+            await self.wait_for_task(node, upid)
+        except Exception as e:
+            raise Exception(f"Failed to delete snapshot {name} of VM {vmid}: {str(e)}")
+
+    async def prune_snapshots(
+        self, vmid: int, vm_type: VMType, keep: int, pinned: Collection[str] = ()
+    ) -> int:
+        """Delete all but the newest ``keep`` snapshots of a guest.
+
+        ``pinned`` snapshots are neither deleted nor counted towards ``keep``,
+        so newer snapshots never push them out. The snapshot the guest
+        currently runs from is never deleted either, since it is typically
+        the checkpoint the guest will be rolled back to.
+        Returns the number of snapshots deleted.
+        """
+        loop = asyncio.get_running_loop()
+        entries = await loop.run_in_executor(
+            None, lambda: self._guest(vmid, vm_type)[1].snapshot.get()
+        )
+        parent = next((s.get('parent') for s in entries if s.get('name') == 'current'), None)
+        snapshots = sorted(
+            (s for s in entries if s.get('name') != 'current' and s.get('name') not in pinned),
+            key=lambda s: s.get('snaptime', 0),
+            reverse=True
+        )
+        deleted = 0
+        for snapshot in snapshots[keep:]:
+            if snapshot['name'] == parent:
+                continue
+            await self.delete_snapshot(vmid, vm_type, snapshot['name'])
+            deleted += 1
+        return deleted
 
     async def get_vm_status(self, vmid: int) -> Dict[str, Any]:
         """Get VM status and resource usage."""
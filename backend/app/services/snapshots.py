@@ -0,0 +1,92 @@
+import asyncio
+import os
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set
+
+from ..database import SessionLocal
+from ..models.virtual_machine import PinnedSnapshot, VirtualMachine
+from .clusters import cluster_registry
+from .proxmox import ProxmoxService
+
+SNAPSHOT_RETENTION = int(os.getenv("SNAPSHOT_RETENTION", "5"))
+SNAPSHOT_PRUNE_INTERVAL = int(os.getenv("SNAPSHOT_PRUNE_INTERVAL_SECONDS", "3600"))
+SNAPSHOT_PRUNE_NODE_CONCURRENCY = int(os.getenv("SNAPSHOT_PRUNE_NODE_CONCURRENCY", "2"))
+
+
+class SnapshotPruner:
+    """Keeps at most ``SNAPSHOT_RETENTION`` snapshots per VM, plus its pinned ones.
+
+    Runs every ``SNAPSHOT_PRUNE_INTERVAL`` seconds over all clusters in
+    parallel, with at most ``SNAPSHOT_PRUNE_NODE_CONCURRENCY`` deletions per
+    node so pruning never competes with rollbacks for storage I/O.
+    """
+
+    def __init__(self, keep: int = SNAPSHOT_RETENTION):
+        self.keep = keep
+        self._task: Optional[asyncio.Task] = None
+
+    async def prune_cluster(
+        self, cluster_id: str, rows: List[Any], pinned: Optional[Dict[int, Set[str]]] = None
+    ) -> int:
+        proxmox = await ProxmoxService.connect(cluster_id)
+        vm_types = {row.proxmox_id: row.vm_type for row in rows}
+        pinned = pinned or {}
+        deleted: Dict[int, int] = {}
+
+        async def prune(vmid: int) -> None:
+            deleted[vmid] = await proxmox.prune_snapshots(
+                vmid, vm_types[vmid], self.keep, pinned.get(vmid, set())
+            )
+
+        await proxmox.gather_bulk(list(vm_types), prune, SNAPSHOT_PRUNE_NODE_CONCURRENCY)
+        return sum(deleted.values())
+
+    async def prune(self) -> int:
+        """Run one pruning pass and return the number of snapshots deleted."""
+        db = SessionLocal()
+        try:
+            rows = db.query(
+                VirtualMachine.cluster_id,
+                VirtualMachine.proxmox_id,
+                VirtualMachine.vm_type
+            ).all()
+            pins = db.query(
+                VirtualMachine.cluster_id,
+                VirtualMachine.proxmox_id,
+                PinnedSnapshot.name
+            ).join(PinnedSnapshot, PinnedSnapshot.vm_id == VirtualMachine.id).all()
+        finally:
+            db.close()
+
+        by_cluster: Dict[str, List[Any]] = defaultdict(list)
+        for row in rows:
+            by_cluster[row.cluster_id].append(row)
+        pinned: Dict[str, Dict[int, Set[str]]] = defaultdict(lambda: defaultdict(set))
+        for pin in pins:
+            pinned[pin.cluster_id][pin.proxmox_id].add(pin.name)
+
+        results = await cluster_registry.fan_out(
+            lambda cluster_id: self.prune_cluster(cluster_id, by_cluster[cluster_id], pinned[cluster_id]),
+            [cluster_id for cluster_id in by_cluster if cluster_id in cluster_registry.configs]
+        )
+        return sum(result for result in results.values() if not isinstance(result, Exception))
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(SNAPSHOT_PRUNE_INTERVAL)
+            try:
+                await self.prune()
+            except Exception:
+                pass  # Try again on the next pass
+
+    def start(self) -> None:
+        if self._task is None and self.keep > 0 and SNAPSHOT_PRUNE_INTERVAL > 0:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+snapshot_pruner = SnapshotPruner()
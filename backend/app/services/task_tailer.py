@@ -0,0 +1,232 @@
+import asyncio
+import os
+from typing import Any, Dict, List, Optional
+
+from ..database import SessionLocal
+from ..models.virtual_machine import VirtualMachine, VMStatus
+from .clusters import cluster_registry
+from .proxmox import ProxmoxService
+
+TASK_TAIL_INTERVAL = int(os.getenv("TASK_TAIL_INTERVAL_SECONDS", "5"))
+# How far behind the newest task a late-arriving task is still picked up
+TASK_TAIL_LOOKBACK = int(os.getenv("TASK_TAIL_LOOKBACK_SECONDS", "300"))
+
+# Proxmox task type (without the qm/vz prefix) -> resulting guest status
+TASK_STATUS = {
+    "start": VMStatus.RUNNING,
+    "resume": VMStatus.RUNNING,
+    "reboot": VMStatus.RUNNING,
+    "restart": VMStatus.RUNNING,
+    "stop": VMStatus.STOPPED,
+    "shutdown": VMStatus.STOPPED,
+    "suspend": VMStatus.SUSPENDED,
+    "pause": VMStatus.SUSPENDED,
+}
+MIGRATE_TASKS = {"qmigrate", "vzmigrate"}
+DESTROY_TASKS = {"qmdestroy", "vzdestroy"}
+
+
+def _guest_action(task_type: str) -> Optional[str]:
+    """Strip the ``qm``/``vz`` prefix from a guest task type."""
+    for prefix in ("qm", "vz"):
+        if task_type.startswith(prefix):
+            return task_type[len(prefix):]
+    return None
+
+
+class TaskTailer:
+    """Follows ``cluster/tasks`` and turns finished guest tasks into events.
+
+    Each poll is a single ``cluster/tasks`` call per Proxmox cluster, with
+    all clusters polled in parallel. Tasks already seen are skipped by
+    UPID, remembered per cluster for ``TASK_TAIL_LOOKBACK`` seconds; the
+    first poll only records where history ends. For every new finished
+    task the tailer updates
+    ``VirtualMachine.status`` / ``proxmox_node`` (only rows that change),
+    drops cached node lookups, and hands an event dict to every
+    subscriber queue.
+
+    Started with ``apply=False`` (in every worker but the one running the
+    background tasks) it only drops the cached node lookups of this
+    process, so no worker keeps routing requests to a guest's old node.
+    """
+
+    def __init__(self):
+        # cluster_id -> {"newest": newest endtime seen, "seen": {upid: endtime}}
+        self.cursors: Dict[str, Dict[str, Any]] = {}
+        self.subscribers: List[asyncio.Queue] = []
+        self.apply = True
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, maxsize: int = 1000) -> asyncio.Queue:
+        """Get a queue receiving every event; events are dropped when it is full."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        if queue in self.subscribers:
+            self.subscribers.remove(queue)
+
+    def _new_tasks(self, cluster_id: str, tasks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Finished tasks not yet processed, oldest first; advances the cursor.
+
+        ``cluster/tasks`` merges the task lists every node broadcasts, so a
+        task can show up after newer tasks of another node. Any finished
+        task that is not among the seen UPIDs and ended at most
+        ``TASK_TAIL_LOOKBACK`` seconds before the newest one is therefore
+        new. The first call for a cluster only seeds the cursor, so history
+        from before startup is not replayed.
+        """
+        finished = [task for task in tasks if task.get("endtime")]
+        cursor = self.cursors.get(cluster_id)
+        new: List[Dict[str, Any]] = []
+        if cursor is None:
+            cursor = self.cursors[cluster_id] = {"newest": 0, "seen": {}}
+        else:
+            cutoff = cursor["newest"] - TASK_TAIL_LOOKBACK
+            new = [
+                task for task in finished
+                if task["upid"] not in cursor["seen"] and task["endtime"] >= cutoff
+            ]
+            new.sort(key=lambda task: (task["endtime"], task["starttime"]))
+
+        cursor["newest"] = max([cursor["newest"], *(task["endtime"] for task in finished)])
+        cutoff = cursor["newest"] - TASK_TAIL_LOOKBACK
+        seen = {**cursor["seen"], **{task["upid"]: task["endtime"] for task in finished}}
+        cursor["seen"] = {upid: endtime for upid, endtime in seen.items() if endtime >= cutoff}
+        return new
+
+    def replay(self, seconds: int) -> None:
+        """Process tasks that ended in the last ``seconds`` again on the next poll.
+
+        Used when this worker takes over applying tasks from another one.
+        Applying a task twice leaves the VM row as it was, and accounting
+        ignores transitions it already recorded.
+        """
+        for cursor in self.cursors.values():
+            since = cursor["newest"] - seconds
+            cursor["seen"] = {upid: endtime for upid, endtime in cursor["seen"].items() if endtime < since}
+
+    @staticmethod
+    def _to_event(cluster_id: str, task: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        action = _guest_action(task.get("type", ""))
+        if action is None or not str(task.get("id", "")).isdigit():
+            return None
+        return {
+            "cluster_id": cluster_id,
+            "upid": task["upid"],
+            "vmid": int(task["id"]),
+            "node": task["node"],
+            "type": task["type"],
+            "action": action,
+            "ok": task.get("status") == "OK",
+            "status": task.get("status"),
+            "user": task.get("user"),
+            "endtime": task["endtime"],
+        }
+
+    def _apply(self, cluster_id: str, events: List[Dict[str, Any]], guest_nodes: Dict[int, str]) -> int:
+        """Write the final status and node of each affected guest; returns rows changed."""
+        final: Dict[int, Dict[str, Any]] = {}
+        for event in events:
+            if not event["ok"]:
+                continue
+            changes = final.setdefault(event["vmid"], {})
+            if event["action"] in TASK_STATUS:
+                changes["status"] = TASK_STATUS[event["action"]]
+            if event["type"] in MIGRATE_TASKS and event["vmid"] in guest_nodes:
+                changes["proxmox_node"] = guest_nodes[event["vmid"]]
+        final = {vmid: changes for vmid, changes in final.items() if changes}
+        if not final:
+            return 0
+
+        db = SessionLocal()
+        try:
+            rows = db.query(
+                VirtualMachine.id,
+                VirtualMachine.proxmox_id,
+                VirtualMachine.status,
+                VirtualMachine.proxmox_node
+            ).filter(
+                VirtualMachine.cluster_id == cluster_id,
+                VirtualMachine.proxmox_id.in_(final.keys())
+            ).all()
+            updates = []
+            for row in rows:
+                changes = final[row.proxmox_id]
+                if any(getattr(row, key) != value for key, value in changes.items()):
+                    updates.append({"id": row.id, **changes})
+            if updates:
+                db.bulk_update_mappings(VirtualMachine, updates)
+                db.commit()
+            return len(updates)
+        finally:
+            db.close()
+
+    def _publish(self, event: Dict[str, Any]) -> None:
+        for queue in self.subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                pass  # Slow subscriber; drop rather than block the tailer
+
+    async def poll_cluster(self, cluster_id: str) -> List[Dict[str, Any]]:
+        """Process tasks of one cluster finished since its last poll."""
+        loop = asyncio.get_running_loop()
+        proxmox = await ProxmoxService.connect(cluster_id)
+        tasks = await loop.run_in_executor(None, proxmox.proxmox.cluster.tasks.get)
+        events = [
+            event for event in (self._to_event(cluster_id, task) for task in self._new_tasks(cluster_id, tasks))
+            if event
+        ]
+        if not events:
+            return []
+
+        guest_nodes: Dict[int, str] = {}
+        for event in events:
+            if event["type"] in MIGRATE_TASKS or event["type"] in DESTROY_TASKS:
+                proxmox.node_cache.invalidate(event["vmid"])
+        if not self.apply:
+            return events
+        if any(event["type"] in MIGRATE_TASKS and event["ok"] for event in events):
+            guests = await loop.run_in_executor(None, proxmox.get_cluster_guests)
+            guest_nodes = {vmid: guest["node"] for vmid, guest in guests.items()}
+            proxmox.node_cache.refresh(guest_nodes)
+
+        await loop.run_in_executor(None, self._apply, cluster_id, events, guest_nodes)
+        for event in events:
+            self._publish(event)
+        return events
+
+    async def poll(self) -> List[Dict[str, Any]]:
+        """Poll every cluster in parallel and return all new events."""
+        results = await cluster_registry.fan_out(self.poll_cluster)
+        events: List[Dict[str, Any]] = []
+        for cluster_id, result in results.items():
+            if isinstance(result, Exception):
+                cluster_registry.reset(cluster_id)  # Log in again next time
+            else:
+                events.extend(result)
+        return events
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.poll()
+            except Exception:
+                pass  # The database may be briefly unavailable
+            await asyncio.sleep(TASK_TAIL_INTERVAL)
+
+    def start(self, apply: bool = True) -> None:
+        self.apply = apply
+        if self._task is None and TASK_TAIL_INTERVAL > 0:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+task_tailer = TaskTailer()
@@ -0,0 +1,456 @@
+"""A small in-process fake of the Proxmox VE HTTP API.
+
+Implements just enough of ``/api2/json`` for ``ProxmoxService`` to run
+against it: ticket auth, cluster resources, node listing, guest create,
+clone, config, guest agent / LXC interfaces, status actions, migrate,
+snapshots, delete and task status. Every request sleeps for a configurable latency
+so benchmarks see realistic round-trip costs.
+
+Run standalone with ``python -m benchmarks.fake_proxmox --guests 500``.
+"""
+import argparse
+import datetime
+import json
+import os
+import re
+import ssl
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlparse
+
+
+def _generate_self_signed_cert(directory: str) -> Tuple[str, str]:
+    """Write a throwaway self-signed certificate; proxmoxer only speaks HTTPS."""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "fake-proxmox")])
+    now = datetime.datetime.utcnow()
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=30))
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = os.path.join(directory, "cert.pem")
+    key_path = os.path.join(directory, "key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption()
+        ))
+    return cert_path, key_path
+
+
+class FakeError(Exception):
+    """Fail a request with this message as the HTTP reason, like Proxmox does."""
+
+
+class FakeCluster:
+    """In-memory cluster state shared by all request handler threads."""
+
+    def __init__(self, nodes: int = 3, guests: int = 100, first_vmid: int = 100):
+        self.lock = threading.Lock()
+        self.nodes = [f"node{i + 1}" for i in range(nodes)]
+        self.guests: Dict[int, Dict[str, Any]] = {}
+        self.tasks: Dict[str, Dict[str, Any]] = {}
+        self.task_counter = 0
+        # Task types (e.g. "lxccreate") whose tasks end with an error
+        self.failing_tasks: Set[str] = set()
+        for i in range(guests):
+            vmid = first_vmid + i
+            self.add_guest(vmid, self.nodes[i % nodes], "qemu" if i % 2 == 0 else "lxc", f"guest-{vmid}")
+
+    def add_guest(self, vmid: int, node: str, guest_type: str, name: str, **config: Any) -> Dict[str, Any]:
+        mac = "BC:24:11:{:02X}:{:02X}:{:02X}".format((vmid >> 16) & 0xFF, (vmid >> 8) & 0xFF, vmid & 0xFF)
+        if guest_type == "qemu":
+            config.setdefault("net0", f"virtio={mac},bridge=vmbr0")
+        else:
+            config.setdefault("net0", f"name=eth0,bridge=vmbr0,hwaddr={mac},ip=dhcp")
+        guest = {
+            "vmid": vmid,
+            "node": node,
+            "type": guest_type,
+            "name": name,
+            "status": "stopped",
+            "mac": mac,
+            "ip": f"10.{(vmid >> 16) & 0xFF}.{(vmid >> 8) & 0xFF}.{vmid & 0xFF}",
+            "config": {"cores": 1, "memory": 1024, **config},
+        }
+        self.guests[vmid] = guest
+        return guest
+
+    def guest(self, vmid: str, kind: str) -> Dict[str, Any]:
+        """Look up a guest addressed as ``qemu`` or ``lxc``; the wrong type is an error."""
+        guest = self.guests.get(int(vmid))
+        if guest is None or guest["type"] != kind:
+            raise FakeError(f"Configuration file '{kind}/{vmid}.conf' does not exist")
+        return guest
+
+    def new_task(self, node: str, task_type: str, vmid: Optional[int] = None) -> str:
+        self.task_counter += 1
+        upid = f"UPID:{node}:{self.task_counter:08X}:00000000:{int(time.time()):08X}:{task_type}:{vmid or ''}:root@pam:"
+        self.tasks[upid] = {
+            "upid": upid,
+            "node": node,
+            "type": task_type,
+            "id": str(vmid or ""),
+            "user": "root@pam",
+            "starttime": int(time.time()),
+            "endtime": int(time.time()),
+            "status": "stopped",
+            "exitstatus": "command failed" if task_type in self.failing_tasks else "OK",
+        }
+        return upid
+
+    def resource(self, guest: Dict[str, Any]) -> Dict[str, Any]:
+        running = guest["status"] == "running"
+        return {
+            "id": f"{guest['type']}/{guest['vmid']}",
+            "type": guest["type"],
+            "vmid": guest["vmid"],
+            "node": guest["node"],
+            "name": guest["name"],
+            "status": guest["status"],
+            "cpu": 0.12 if running else 0,
+            "maxcpu": guest["config"].get("cores", 1),
+            "mem": guest["config"].get("memory", 1024) * 1024 * 1024 // 2 if running else 0,
+            "maxmem": guest["config"].get("memory", 1024) * 1024 * 1024,
+            "disk": 0,
+            "maxdisk": 10 * 1024 ** 3,
+        }
+
+
+Route = Tuple[str, "re.Pattern[str]", Callable[..., Any]]
+
+
+class FakeProxmoxHandler(BaseHTTPRequestHandler):
+    cluster: FakeCluster
+    latency: float = 0.0
+    routes: List[Route] = []
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _params(self) -> Dict[str, str]:
+        parsed = urlparse(self.path)
+        params = dict(parse_qsl(parsed.query))
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            body = self.rfile.read(length).decode()
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                params.update(json.loads(body))
+            else:
+                params.update(parse_qsl(body))
+        return params
+
+    def _send(self, status: int, data: Any, message: Optional[str] = None) -> None:
+        body = json.dumps({"data": data}).encode()
+        self.send_response(status, message)
+        self.send_header("Content-Type", "application/json;charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self, method: str) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        path = urlparse(self.path).path
+        params = self._params()
+        for route_method, pattern, handler in self.routes:
+            match = pattern.fullmatch(path)
+            if route_method == method and match:
+                try:
+                    with self.cluster.lock:
+                        result = handler(self.cluster, params, **match.groupdict())
+                except KeyError:
+                    self._send(500, None)
+                    return
+                except FakeError as e:
+                    self._send(500, None, str(e))
+                    return
+                self._send(200, result)
+                return
+        self._send(501, None)
+
+    def do_GET(self) -> None:
+        self._dispatch("GET")
+
+    def do_POST(self) -> None:
+        self._dispatch("POST")
+
+    def do_PUT(self) -> None:
+        self._dispatch("PUT")
+
+    def do_DELETE(self) -> None:
+        self._dispatch("DELETE")
+
+
+def route(method: str, path: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Register a handler for ``/api2/json<path>``; ``{name}`` captures a segment."""
+    regex = re.compile("/api2/json" + re.sub(r"{(\w+)}", r"(?P<\1>[^/]+)", path))
+
+    def decorator(handler: Callable[..., Any]) -> Callable[..., Any]:
+        FakeProxmoxHandler.routes.append((method, regex, handler))
+        return handler
+    return decorator
+
+
+@route("POST", "/access/ticket")
+def _ticket(cluster: FakeCluster, params: Dict[str, str]) -> Dict[str, Any]:
+    return {
+        "username": params.get("username", "root@pam"),
+        "ticket": "PVE:root@pam:FAKE::ticket",
+        "CSRFPreventionToken": "FAKE:csrf",
+    }
+
+
+@route("GET", "/version")
+def _version(cluster: FakeCluster, params: Dict[str, str]) -> Dict[str, Any]:
+    return {"version": "8.1.0", "release": "8.1", "repoid": "fake"}
+
+
+@route("GET", "/cluster/resources")
+def _resources(cluster: FakeCluster, params: Dict[str, str]) -> List[Dict[str, Any]]:
+    resources = [cluster.resource(guest) for guest in cluster.guests.values()]
+    if params.get("type") in (None, "node"):
+        nodes = [{"id": f"node/{n}", "type": "node", "node": n, "status": "online"} for n in cluster.nodes]
+        resources = nodes if params.get("type") == "node" else resources + nodes
+    return resources
+
+
+@route("GET", "/cluster/tasks")
+def _cluster_tasks(cluster: FakeCluster, params: Dict[str, str]) -> List[Dict[str, Any]]:
+    # cluster/tasks reports the exit status as "status" for finished tasks
+    recent = sorted(cluster.tasks.values(), key=lambda t: t["starttime"], reverse=True)[:50]
+    return [{**task, "status": task["exitstatus"]} for task in recent]
+
+
+@route("GET", "/nodes")
+def _nodes(cluster: FakeCluster, params: Dict[str, str]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "node": node,
+            "status": "online",
+            "maxcpu": 32,
+            "cpu": 0.1,
+            "maxmem": 128 * 1024 ** 3,
+            "mem": sum(
+                g["config"].get("memory", 0) * 1024 ** 2
+                for g in cluster.guests.values() if g["node"] == node
+            ),
+        }
+        for node in cluster.nodes
+    ]
+
+
+@route("GET", "/nodes/{node}/tasks/{upid}/status")
+def _task_status(cluster: FakeCluster, params: Dict[str, str], node: str, upid: str) -> Dict[str, Any]:
+    return cluster.tasks[upid]
+
+
+@route("POST", "/nodes/{node}/{kind}")
+def _create(cluster: FakeCluster, params: Dict[str, str], node: str, kind: str) -> str:
+    vmid = int(params["vmid"])
+    if node not in cluster.nodes:
+        raise FakeError(f"no such node '{node}'")
+    if vmid in cluster.guests:
+        raise FakeError(f"unable to create VM {vmid} - VM {vmid} already exists on node '{node}'")
+    cluster.add_guest(vmid, node, kind, params.get("name") or params.get("hostname", ""))
+    return cluster.new_task(node, f"{kind}create", vmid)
+
+
+@route("POST", "/nodes/{node}/{kind}/{vmid}/clone")
+def _clone(cluster: FakeCluster, params: Dict[str, str], node: str, kind: str, vmid: str) -> str:
+    source = cluster.guest(vmid, kind)
+    newid = int(params["newid"])
+    if newid in cluster.guests:
+        raise FakeError(f"unable to create VM {newid}: config file already exists")
+    target = params.get("target") or node
+    cluster.add_guest(newid, target, kind, params.get("name", ""), **source["config"])
+    return cluster.new_task(node, f"{kind}clone", int(vmid))
+
+
+@route("GET", "/nodes/{node}/{kind}/{vmid}/config")
+def _get_config(cluster: FakeCluster, params: Dict[str, str], node: str, kind: str, vmid: str) -> Dict[str, Any]:
+    return cluster.guest(vmid, kind)["config"]
+
+
+@route("PUT", "/nodes/{node}/{kind}/{vmid}/config")
+def _put_config(cluster: FakeCluster, params: Dict[str, str], node: str, kind: str, vmid: str) -> None:
+    cluster.guest(vmid, kind)["config"].update(params)
+    return None
+
+
+@route("GET", "/nodes/{node}/qemu/{vmid}/agent/network-get-interfaces")
+def _agent_interfaces(cluster: FakeCluster, params: Dict[str, str], node: str, vmid: str) -> Dict[str, Any]:
+    guest = cluster.guests[int(vmid)]
+    if guest["status"] != "running":
+        raise KeyError(vmid)
+    return {"result": [
+        {"name": "lo", "hardware-address": "00:00:00:00:00:00",
+         "ip-addresses": [{"ip-address-type": "ipv4", "ip-address": "127.0.0.1", "prefix": 8}]},
+        {"name": "eth0", "hardware-address": guest["mac"].lower(),
+         "ip-addresses": [{"ip-address-type": "ipv4", "ip-address": guest["ip"], "prefix": 24}]},
+    ]}
+
+
+@route("GET", "/nodes/{node}/lxc/{vmid}/interfaces")
+def _lxc_interfaces(cluster: FakeCluster, params: Dict[str, str], node: str, vmid: str) -> List[Dict[str, Any]]:
+    guest = cluster.guests[int(vmid)]
+    return [
+        {"name": "lo", "hwaddr": "00:00:00:00:00:00", "inet": "127.0.0.1/8"},
+        {"name": "eth0", "hwaddr": guest["mac"].lower(), "inet": f"{guest['ip']}/24"},
+    ]
+
+
+@route("GET", "/nodes/{node}/{kind}/{vmid}/status/current")
+def _status_current(cluster: FakeCluster, params: Dict[str, str], node: str, kind: str, vmid: str) -> Dict[str, Any]:
+    return cluster.resource(cluster.guest(vmid, kind))
+
+
+@route("POST", "/nodes/{node}/{kind}/{vmid}/status/{action}")
+def _status_action(cluster: FakeCluster, params: Dict[str, str], node: str, kind: str, vmid: str, action: str) -> str:
+    guest = cluster.guest(vmid, kind)
+    guest["status"] = {
+        "start": "running",
+        "stop": "stopped",
+        "shutdown": "stopped",
+        "restart": "running",
+        "reboot": "running",
+        "suspend": "paused",
+        "resume": "running",
+    }.get(action, guest["status"])
+    return cluster.new_task(node, f"{kind}{action}", int(vmid))
+
+
+@route("POST", "/nodes/{node}/{kind}/{vmid}/migrate")
+def _migrate(cluster: FakeCluster, params: Dict[str, str], node: str, kind: str, vmid: str) -> str:
+    guest = cluster.guest(vmid, kind)
+    if params["target"] not in cluster.nodes:
+        raise KeyError(params["target"])
+    guest["node"] = params["target"]
+    return cluster.new_task(node, "qmigrate" if kind == "qemu" else "vzmigrate", int(vmid))
+
+
+@route("GET", "/nodes/{node}/{kind}/{vmid}/snapshot")
+def _list_snapshots(cluster: FakeCluster, params: Dict[str, str], node: str, kind: str, vmid: str) -> List[Dict[str, Any]]:
+    guest = cluster.guest(vmid, kind)
+    snapshots = guest.setdefault("snapshots", [])
+    parent = snapshots[-1]["name"] if snapshots else None
+    return snapshots + [{"name": "current", "description": "You are here!", "parent": parent}]
+
+
+@route("POST", "/nodes/{node}/{kind}/{vmid}/snapshot")
+def _create_snapshot(cluster: FakeCluster, params: Dict[str, str], node: str, kind: str, vmid: str) -> str:
+    guest = cluster.guest(vmid, kind)
+    snapshots = guest.setdefault("snapshots", [])
+    snapshots.append({
+        "name": params["snapname"],
+        "description": params.get("description", ""),
+        "snaptime": int(time.time()),
+        "parent": snapshots[-1]["name"] if snapshots else None,
+    })
+    return cluster.new_task(node, f"{kind}snapshot", int(vmid))
+
+
+@route("POST", "/nodes/{node}/{kind}/{vmid}/snapshot/{name}/rollback")
+def _rollback_snapshot(cluster: FakeCluster, params: Dict[str, str], node: str, kind: str, vmid: str, name: str) -> str:
+    guest = cluster.guest(vmid, kind)
+    if not any(s["name"] == name for s in guest.get("snapshots", [])):
+        raise KeyError(name)
+    guest["status"] = "running" if params.get("start") in ("1", 1) else "stopped"
+    return cluster.new_task(node, f"{kind}rollback", int(vmid))
+
+
+@route("DELETE", "/nodes/{node}/{kind}/{vmid}/snapshot/{name}")
+def _delete_snapshot(cluster: FakeCluster, params: Dict[str, str], node: str, kind: str, vmid: str, name: str) -> str:
+    guest = cluster.guest(vmid, kind)
+    guest["snapshots"] = [s for s in guest.get("snapshots", []) if s["name"] != name]
+    return cluster.new_task(node, f"{kind}delsnapshot", int(vmid))
+
+
+@route("DELETE", "/nodes/{node}/{kind}/{vmid}")
+def _delete(cluster: FakeCluster, params: Dict[str, str], node: str, kind: str, vmid: str) -> str:
+    cluster.guest(vmid, kind)
+    del cluster.guests[int(vmid)]
+    return cluster.new_task(node, f"{kind}destroy", int(vmid))
+
+
+class FakeProxmoxServer:
+    """Serve a ``FakeCluster`` over HTTPS from a background thread."""
+
+    def __init__(
+        self,
+        nodes: int = 3,
+        guests: int = 100,
+        latency_ms: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0
+    ):
+        self.cluster = FakeCluster(nodes=nodes, guests=guests)
+        handler = type("Handler", (FakeProxmoxHandler,), {
+            "cluster": self.cluster,
+            "latency": latency_ms / 1000.0,
+        })
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._certdir = tempfile.TemporaryDirectory()
+        cert, key = _generate_self_signed_cert(self._certdir.name)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        self.httpd.socket = context.wrap_socket(self.httpd.socket, server_side=True)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> str:
+        """``host:port`` suitable for ``PROXMOX_HOST``."""
+        host, port = self.httpd.server_address[:2]
+        return f"{host}:{port}"
+
+    def start(self) -> "FakeProxmoxServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self._certdir.cleanup()
+
+    def __enter__(self) -> "FakeProxmoxServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake Proxmox API server")
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--guests", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=8006)
+    args = parser.parse_args()
+
+    server = FakeProxmoxServer(args.nodes, args.guests, args.latency_ms, port=args.port)
+    print(f"Fake Proxmox listening on https://{server.address}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,106 @@
+"""Database fixtures for benchmarks.
+
+``DATABASE_URL`` must point at the benchmark database before anything from
+``app`` is imported, because the database URL is read at import time. SQLite
+is used by default; pass a MySQL URL to benchmark against a real server.
+Its database is wiped, so its name must contain ``bench`` (e.g.
+``lab_bench``); anything else is refused.
+"""
+import os
+from typing import Any, Dict, List
+
+BENCH_PASSWORD = "benchmark"
+
+
+def configure_environment(database_url: str, proxmox_host: str) -> Dict[str, str]:
+    """Point the app at the benchmark database and fake Proxmox server."""
+    env = {
+        "DATABASE_URL": database_url,
+        "PROXMOX_HOST": proxmox_host,
+        "PROXMOX_USER": "root@pam",
+        "PROXMOX_PASSWORD": "benchmark",
+        "SECRET_KEY": "benchmark-secret",
+    }
+    os.environ.update(env)
+    return env
+
+
+def check_benchmark_database(database: str) -> None:
+    """Refuse to wipe a database whose name does not mark it as a benchmark database."""
+    name = os.path.basename(database or "")
+    if "bench" not in name.lower():
+        raise SystemExit(
+            f"Refusing to drop all tables of database {name!r}: "
+            "benchmark database names must contain 'bench', e.g. lab_bench"
+        )
+
+
+def create_database(users: int, guests: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Create the schema and seed one admin, ``users`` students and a VM row per guest.
+
+    Guests are assigned to students round-robin. Existing tables are dropped
+    first, see ``check_benchmark_database``. Returns the credentials and ids
+    the benchmark scenarios need.
+    """
+    from alembic import command
+    from app.database import Base, get_engine, dispose_engine, SessionLocal, alembic_config
+    from app.models.user import User, UserRole
+    from app.models.virtual_machine import VirtualMachine, VMType, VMStatus
+    import app.models.usage, app.models.drain, app.models.console  # noqa: F401,E401  (register the tables)
+    from app.routers.auth import get_password_hash
+
+    check_benchmark_database(get_engine().url.database)
+    Base.metadata.drop_all(bind=get_engine())
+    Base.metadata.create_all(bind=get_engine())
+    # Mark the schema current so the API's startup schema check passes
+    command.stamp(alembic_config(), "head")
+
+    hashed_password = get_password_hash(BENCH_PASSWORD)
+    db = SessionLocal()
+    try:
+        admin = User(
+            username="bench-admin",
+            email="bench-admin@example.com",
+            hashed_password=hashed_password,
+            role=UserRole.ADMIN
+        )
+        students = [
+            User(
+                username=f"bench-student-{i}",
+                email=f"bench-student-{i}@example.com",
+                hashed_password=hashed_password,
+                role=UserRole.STUDENT
+            )
+            for i in range(users)
+        ]
+        db.add(admin)
+        db.add_all(students)
+        db.flush()
+
+        vms = [
+            VirtualMachine(
+                name=guest["name"],
+                vm_type=VMType.KVM if guest["type"] == "qemu" else VMType.LXC,
+                status=VMStatus.RUNNING if guest["status"] == "running" else VMStatus.STOPPED,
+                proxmox_id=guest["vmid"],
+                proxmox_node=guest["node"],
+                owner_id=students[i % len(students)].id if students else admin.id
+            )
+            for i, guest in enumerate(guests)
+        ]
+        db.add_all(vms)
+        db.flush()
+
+        fixture = {
+            "admin": {"username": admin.username, "password": BENCH_PASSWORD},
+            "students": [
+                {"id": s.id, "username": s.username, "password": BENCH_PASSWORD}
+                for s in students
+            ],
+            "vm_ids": [vm.id for vm in vms],
+        }
+        db.commit()
+        return fixture
+    finally:
+        db.close()
+        dispose_engine()
@@ -0,0 +1,298 @@
+"""Benchmark harness for the Lab Management API.
+
+Starts a fake Proxmox server, seeds a benchmark database, launches the API
+with uvicorn and drives each scenario at a fixed concurrency, recording
+p50/p90/p99 latency and throughput. Results are written as JSON tagged with
+the current git commit so runs can be compared across changes:
+
+    python -m benchmarks.run --guests 500 --latency-ms 20 --concurrency 16
+    python -m benchmarks.run --compare results/a.json results/b.json
+"""
+import argparse
+import datetime
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+from .fake_proxmox import FakeProxmoxServer
+from .fixtures import configure_environment, create_database
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+SCENARIOS = ["login", "list", "action", "create", "delete"]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class ApiServer:
+    """Run the API in a uvicorn or gunicorn subprocess for the duration of a benchmark.
+
+    ``startup_ms`` is the time from launching the process until ``/health``
+    first answered.
+    """
+
+    def __init__(self, env: Dict[str, str], workers: int = 1, server: str = "uvicorn"):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.env = {**os.environ, **env}
+        self.workers = workers
+        self.server = server
+        self.process: Optional[subprocess.Popen] = None
+        self.startup_ms: Optional[float] = None
+
+    def command(self) -> List[str]:
+        if self.server == "gunicorn":
+            return [
+                sys.executable, "-m", "gunicorn", "app.main:app",
+                "--config", "gunicorn.conf.py",
+                "--bind", f"127.0.0.1:{self.port}",
+                "--workers", str(self.workers),
+                "--access-logfile", "/dev/null",
+                "--log-level", "warning",
+            ]
+        return [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1",
+            "--port", str(self.port),
+            "--workers", str(self.workers),
+            "--log-level", "warning",
+        ]
+
+    def __enter__(self) -> "ApiServer":
+        started = time.perf_counter()
+        self.process = subprocess.Popen(self.command(), cwd=BACKEND_DIR, env=self.env)
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError("API server exited during startup")
+            try:
+                if requests.get(f"{self.url}/health", timeout=1).ok:
+                    self.startup_ms = (time.perf_counter() - started) * 1000
+                    return self
+            except (requests.ConnectionError, requests.Timeout):
+                pass  # Not accepting or not answering yet
+            time.sleep(0.02)
+        self.__exit__()
+        raise RuntimeError("API server did not become healthy in time")
+
+    def __exit__(self, *exc: Any) -> None:
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+
+def run_scenario(
+    name: str,
+    request: Callable[[requests.Session, int], requests.Response],
+    total: int,
+    concurrency: int
+) -> Dict[str, Any]:
+    """Issue ``total`` requests from ``concurrency`` threads and summarise latency."""
+    local = threading.local()
+    latencies: List[float] = []
+    errors: List[str] = []
+    lock = threading.Lock()
+
+    def one(i: int) -> None:
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = request(local.session, i)
+            error = None if response.ok else f"{response.status_code}: {response.text[:200]}"
+        except requests.RequestException as e:
+            error = str(e)
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            latencies.append(elapsed)
+            if error:
+                errors.append(error)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    result = {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": len(errors),
+        "mean_ms": sum(latencies) / len(latencies) if latencies else 0.0,
+        "p50_ms": _percentile(latencies, 50),
+        "p90_ms": _percentile(latencies, 90),
+        "p99_ms": _percentile(latencies, 99),
+        "max_ms": latencies[-1] if latencies else 0.0,
+        "throughput_rps": total / wall if wall else 0.0,
+    }
+    if errors:
+        result["sample_error"] = errors[0]
+    print(
+        f"{name:<8} n={total:<5} c={concurrency:<3} "
+        f"p50={result['p50_ms']:8.1f}ms p99={result['p99_ms']:8.1f}ms "
+        f"rps={result['throughput_rps']:8.1f} errors={len(errors)}"
+    )
+    return result
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    needed = 2 * args.requests if {"action", "delete"} <= set(args.scenarios) else args.requests
+    if args.guests < needed:
+        raise SystemExit(f"--guests must be at least {needed} for the selected scenarios")
+
+    with tempfile.TemporaryDirectory() as tmpdir, \
+            FakeProxmoxServer(args.nodes, args.guests, args.latency_ms) as proxmox:
+        database_url = args.database_url or f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+        env = configure_environment(database_url, proxmox.address)
+        fixture = create_database(args.users, list(proxmox.cluster.guests.values()))
+
+        with ApiServer(env, workers=args.workers, server=args.server) as api:
+            print(f"startup  {api.startup_ms:8.1f}ms to first /health")
+            admin = requests.post(f"{api.url}/auth/login", json=fixture["admin"]).json()
+            headers = {"Authorization": f"Bearer {admin['access_token']}"}
+            students = fixture["students"] or [fixture["admin"]]
+            vm_ids = fixture["vm_ids"]
+            action_ids = vm_ids[:args.requests]
+            delete_ids = vm_ids[-args.requests:]
+
+            scenarios: Dict[str, Callable[[requests.Session, int], requests.Response]] = {
+                "login": lambda s, i: s.post(
+                    f"{api.url}/auth/login",
+                    json={k: students[i % len(students)][k] for k in ("username", "password")}
+                ),
+                "list": lambda s, i: s.get(f"{api.url}/vm/", headers=headers),
+                "action": lambda s, i: s.post(
+                    f"{api.url}/vm/{action_ids[i]}/action",
+                    json={"action": "start" if i % 2 == 0 else "stop"},
+                    headers=headers
+                ),
+                "create": lambda s, i: s.post(
+                    f"{api.url}/vm/",
+                    json={
+                        "name": f"bench-{i}",
+                        "vm_type": "lxc" if i % 2 else "kvm",
+                        "proxmox_node": proxmox.cluster.nodes[i % len(proxmox.cluster.nodes)],
+                    },
+                    headers=headers
+                ),
+                "delete": lambda s, i: s.delete(f"{api.url}/vm/{delete_ids[i]}", headers=headers),
+            }
+
+            results = {
+                name: run_scenario(name, scenarios[name], args.requests, args.concurrency)
+                for name in args.scenarios
+            }
+            startup_ms = api.startup_ms
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "config": {
+            "nodes": args.nodes,
+            "guests": args.guests,
+            "users": args.users,
+            "latency_ms": args.latency_ms,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "workers": args.workers,
+            "server": args.server,
+            "database": "sqlite" if not args.database_url else args.database_url.split(":", 1)[0],
+        },
+        "startup_ms": startup_ms,
+        "scenarios": results,
+    }
+
+
+def compare(baseline_path: str, candidate_path: str) -> None:
+    """Print per-scenario deltas between two saved result files."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(candidate_path) as f:
+        candidate = json.load(f)
+
+    print(f"baseline {baseline['commit']} ({baseline['timestamp']}) -> "
+          f"candidate {candidate['commit']} ({candidate['timestamp']})")
+    if baseline.get("startup_ms") and candidate.get("startup_ms"):
+        print(f"startup  {baseline['startup_ms']:.1f}ms -> {candidate['startup_ms']:.1f}ms")
+    for name, new in candidate["scenarios"].items():
+        old = baseline["scenarios"].get(name)
+        if not old:
+            continue
+        cells = []
+        for metric in ("p50_ms", "p99_ms", "throughput_rps"):
+            delta = (new[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+            cells.append(f"{metric}={old[metric]:.1f}->{new[metric]:.1f} ({delta:+.0f}%)")
+        print(f"{name:<8} " + "  ".join(cells))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the Lab Management API")
+    parser.add_argument("--nodes", type=int, default=3, help="Fake cluster nodes")
+    parser.add_argument("--guests", type=int, default=200, help="Fake cluster guests")
+    parser.add_argument("--users", type=int, default=50, help="Seeded student accounts")
+    parser.add_argument("--latency-ms", type=float, default=10.0, help="Fake Proxmox latency per call")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--workers", type=int, default=1, help="API worker processes")
+    parser.add_argument("--server", choices=["uvicorn", "gunicorn"], default="uvicorn",
+                        help="Process model to run the API with")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--database-url", help="Benchmark database, wiped first (its name must contain 'bench'); "
+                        "defaults to a temporary SQLite file")
+    parser.add_argument("--output", default=RESULTS_DIR, help="Directory for result files")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"),
+                        help="Compare two result files instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    result = run(args)
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(
+        args.output,
+        f"{result['timestamp'].replace(':', '')}-{result['commit']}.json"
+    )
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
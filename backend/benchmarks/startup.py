@@ -0,0 +1,67 @@
+"""Measure API time-to-first-request across cold starts.
+
+Each run launches a fresh server process against a seeded database and
+the fake Proxmox server, then records how long it took until ``/health``
+answered and until the first database-backed request (a login) succeeded.
+Compare process models with e.g.:
+
+    python -m benchmarks.startup --runs 5 --server uvicorn --workers 1
+    python -m benchmarks.startup --runs 5 --server gunicorn --workers 4
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from typing import Dict, List
+
+import requests
+
+from .fake_proxmox import FakeProxmoxServer
+from .fixtures import configure_environment, create_database
+from .run import ApiServer
+
+
+def measure(env: Dict[str, str], credentials: Dict[str, str], server: str, workers: int) -> Dict[str, float]:
+    """Start one server and time its first ``/health`` and first login."""
+    started = time.perf_counter()
+    with ApiServer(env, workers=workers, server=server) as api:
+        response = requests.post(f"{api.url}/auth/login", json=credentials, timeout=30)
+        response.raise_for_status()
+        first_request_ms = (time.perf_counter() - started) * 1000
+        return {"health_ms": api.startup_ms, "first_request_ms": first_request_ms}
+
+
+def _summary(values: List[float]) -> str:
+    return (f"median={statistics.median(values):8.1f}ms "
+            f"min={min(values):8.1f}ms max={max(values):8.1f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure API time-to-first-request")
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts to measure")
+    parser.add_argument("--server", choices=["uvicorn", "gunicorn"], default="uvicorn")
+    parser.add_argument("--workers", type=int, default=1, help="API worker processes")
+    parser.add_argument("--database-url", help="Benchmark database, wiped first (its name must contain 'bench'); "
+                        "defaults to a temporary SQLite file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir, FakeProxmoxServer(nodes=1, guests=10) as proxmox:
+        database_url = args.database_url or f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+        env = configure_environment(database_url, proxmox.address)
+        env["BACKGROUND_LOCK_FILE"] = os.path.join(tmpdir, "background.lock")
+        fixture = create_database(1, list(proxmox.cluster.guests.values()))
+
+        runs = []
+        for i in range(args.runs):
+            run = measure(env, fixture["admin"], args.server, args.workers)
+            print(f"run {i + 1}: health={run['health_ms']:8.1f}ms first request={run['first_request_ms']:8.1f}ms")
+            runs.append(run)
+
+    print(f"{args.server} x{args.workers}")
+    print(f"health         {_summary([run['health_ms'] for run in runs])}")
+    print(f"first request  {_summary([run['first_request_ms'] for run in runs])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Gunicorn configuration for running the API with several worker processes.
+
+From the ``backend`` directory, after ``alembic upgrade head``:
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+Every setting can be overridden on the command line or through the
+environment variables read below. How the pieces fit together:
+
+- The master process checks the Alembic schema version once, before
+  forking, and tells the workers to skip the check (``SCHEMA_CHECK=off``).
+  No DDL runs at startup; migrations are applied with ``alembic upgrade``.
+- The app is not preloaded: each worker imports it and creates its own
+  database engine and Proxmox clients lazily, on first use, so no
+  connection is ever shared across a fork. Size the database for
+  ``workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW)`` connections.
+- Exactly one worker runs the cluster-wide background loops (discovery,
+  task tailing, snapshot pruning, usage accounting); see
+  ``BACKGROUND_LOCK_FILE`` in ``app/main.py``. The other workers keep
+  retrying the lock, so one of them takes over when the holder exits,
+  e.g. during a rolling restart (``kill -HUP``). Run further hosts with
+  ``BACKGROUND_TASKS=false``.
+- State that requests share (console sessions and Guacamole connections,
+  node drain jobs) lives in the database, so any worker can answer any
+  request and no sticky routing is needed.
+"""
+import multiprocessing
+import os
+import sys
+
+# The config is read before gunicorn adds the working directory to sys.path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import app  # noqa: E402,F401  (loads .env for the settings below)
+
+# Not HOST/PORT, which also configure the development server
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+# Requests mostly wait on Proxmox and MySQL, so one worker per core is plenty
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = False
+
+# Slow Proxmox calls run in threads, so workers keep heartbeating during them
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+# Let in-flight requests and background loops finish on restart
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+
+def on_starting(server):
+    """Check the schema once in the master instead of in every worker."""
+    from app.database import check_schema
+
+    check_schema()
+    os.environ["SCHEMA_CHECK"] = "off"
@@ -0,0 +1,78 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models.console import ConsoleConnection, ConsoleSession  # noqa: F401 (registers the tables)
+from app.models.drain import NodeDrain  # noqa: F401
+from app.models.usage import UsageDaily, UsageEvent, UsageState  # noqa: F401
+from app.models.user import User, UserRole
+from app.models.virtual_machine import VirtualMachine, VMStatus, VMType
+from app.services.clusters import cluster_registry
+
+
+@pytest.fixture
+def session_factory():
+    """Sessions on a fresh in-memory SQLite database with every table created."""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    yield sessionmaker(bind=engine, autoflush=False)
+    engine.dispose()
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def make_vm(db):
+    """Create a VM (and its owner) and return it."""
+    def make(owner_id: int = 1, status: VMStatus = VMStatus.STOPPED, **fields) -> VirtualMachine:
+        if db.get(User, owner_id) is None:
+            db.add(User(
+                id=owner_id,
+                username=f"user{owner_id}",
+                email=f"user{owner_id}@example.com",
+                hashed_password="x",
+                role=UserRole.STUDENT
+            ))
+        vm = VirtualMachine(
+            name=fields.pop("name", "vm"),
+            vm_type=fields.pop("vm_type", VMType.KVM),
+            status=status,
+            proxmox_id=fields.pop("proxmox_id", 100),
+            proxmox_node=fields.pop("proxmox_node", "pve1"),
+            cpu_cores=fields.pop("cpu_cores", 2),
+            memory_mb=fields.pop("memory_mb", 1024),
+            owner_id=owner_id,
+            **fields
+        )
+        db.add(vm)
+        db.commit()
+        return vm
+    return make
+
+
+@pytest.fixture
+def fake_proxmox(monkeypatch):
+    """Serve the default cluster from a fake Proxmox; returns its ``FakeCluster``.
+
+    The cluster has nodes ``node1``-``node3`` and guests 100-105, KVM at
+    even and LXC at odd VM IDs.
+    """
+    from benchmarks.fake_proxmox import FakeProxmoxServer
+
+    with FakeProxmoxServer(nodes=3, guests=6) as server:
+        config = {**cluster_registry.configs["default"], "host": server.address}
+        monkeypatch.setitem(cluster_registry.configs, "default", config)
+        cluster_registry.reset("default")
+        cluster_registry.node_cache("default").invalidate()
+        yield server.cluster
+    cluster_registry.reset("default")
+    cluster_registry.node_cache("default").invalidate()
@@ -0,0 +1,141 @@
+from datetime import date, datetime
+
+from app.models.usage import UsageDaily, UsageEvent, UsageEventType, UsageState
+from app.models.virtual_machine import VMStatus
+from app.services.accounting import _accrue, checkpoint, record_event, record_events, seed_states, usage_report
+
+
+def _daily(db):
+    return {row.day: row for row in db.query(UsageDaily).order_by(UsageDaily.day)}
+
+
+def test_accrue_splits_usage_at_midnight(db):
+    state = UsageState(
+        vm_id=1, owner_id=1, running=True, cpu_cores=2, memory_mb=1024,
+        accounted_until=datetime(2026, 1, 1, 23, 0)
+    )
+    db.add(state)
+
+    _accrue(db, state, datetime(2026, 1, 3, 1, 30))
+
+    daily = _daily(db)
+    assert [daily[day].running_seconds for day in sorted(daily)] == [3600, 86400, 5400]
+    assert daily[date(2026, 1, 2)].core_seconds == 2 * 86400
+    assert daily[date(2026, 1, 3)].mb_seconds == 1024 * 5400
+    assert state.accounted_until == datetime(2026, 1, 3, 1, 30)
+
+
+def test_accrue_only_moves_the_cursor_of_stopped_vms(db):
+    state = UsageState(
+        vm_id=1, running=False, cpu_cores=1, memory_mb=512,
+        accounted_until=datetime(2026, 1, 1)
+    )
+    db.add(state)
+
+    _accrue(db, state, datetime(2026, 1, 2))
+
+    assert _daily(db) == {}
+    assert state.accounted_until == datetime(2026, 1, 2)
+
+
+def test_accrue_adds_to_a_rollup_another_worker_created(db):
+    db.add(UsageDaily(
+        day=date(2026, 1, 1), vm_id=1, running_seconds=100, core_seconds=100, mb_seconds=51200
+    ))
+    db.commit()
+    state = UsageState(
+        vm_id=1, running=True, cpu_cores=1, memory_mb=512,
+        accounted_until=datetime(2026, 1, 1, 8)
+    )
+    db.add(state)
+
+    _accrue(db, state, datetime(2026, 1, 1, 9))
+
+    assert db.query(UsageDaily).count() == 1
+    assert _daily(db)[date(2026, 1, 1)].running_seconds == 100 + 3600
+
+
+def test_record_event_uses_a_cursor_seeded_meanwhile(db, session_factory, make_vm):
+    vm = make_vm(status=VMStatus.RUNNING)
+    other = session_factory()
+    seed_states(other, datetime(2026, 1, 1, 8))
+    other.commit()
+    other.close()
+
+    assert not record_event(db, vm, UsageEventType.STARTED, datetime(2026, 1, 1, 9))
+    assert record_event(db, vm, UsageEventType.STOPPED, datetime(2026, 1, 1, 10))
+    db.commit()
+
+    assert _daily(db)[date(2026, 1, 1)].running_seconds == 2 * 3600
+
+
+def test_record_event_ignores_repeated_transitions(db, make_vm):
+    vm = make_vm()
+
+    assert record_event(db, vm, UsageEventType.STARTED, datetime(2026, 1, 1, 8))
+    assert not record_event(db, vm, UsageEventType.STARTED, datetime(2026, 1, 1, 9))
+    assert record_event(db, vm, UsageEventType.STOPPED, datetime(2026, 1, 1, 10))
+    assert not record_event(db, vm, UsageEventType.STOPPED, datetime(2026, 1, 1, 11))
+    db.commit()
+
+    events = [event.event for event in db.query(UsageEvent).order_by(UsageEvent.id)]
+    assert events == [UsageEventType.STARTED, UsageEventType.STOPPED]
+    assert _daily(db)[date(2026, 1, 1)].running_seconds == 2 * 3600
+
+
+def test_record_event_ignores_resizes_that_change_nothing(db, make_vm):
+    vm = make_vm()
+    record_event(db, vm, UsageEventType.CREATED, datetime(2026, 1, 1))
+
+    assert not record_event(db, vm, UsageEventType.RESIZED, datetime(2026, 1, 1, 1))
+    vm.cpu_cores = 4
+    assert record_event(db, vm, UsageEventType.RESIZED, datetime(2026, 1, 1, 2))
+
+
+def test_record_events_writes_one_event_per_changed_vm(db, make_vm):
+    running = make_vm(proxmox_id=100)
+    record_event(db, running, UsageEventType.STARTED, datetime(2026, 1, 1))
+    new = make_vm(proxmox_id=101)
+
+    assert record_events(db, [running, new], UsageEventType.STARTED) == 1
+    db.commit()
+
+    assert [(e.vm_id, e.event) for e in db.query(UsageEvent).order_by(UsageEvent.id)] == [
+        (running.id, UsageEventType.STARTED), (new.id, UsageEventType.STARTED)
+    ]
+    assert db.get(UsageState, new.id).running
+
+
+def test_checkpoint_seeds_vms_running_before_accounting(db, make_vm):
+    running = make_vm(status=VMStatus.RUNNING, proxmox_id=100)
+    stopped = make_vm(status=VMStatus.STOPPED, proxmox_id=101)
+
+    checkpoint(db, datetime(2026, 1, 1, 8))
+    checkpoint(db, datetime(2026, 1, 1, 9))
+
+    states = {state.vm_id: state for state in db.query(UsageState)}
+    assert states[running.id].running and not states[stopped.id].running
+    rollups = db.query(UsageDaily).all()
+    assert [(row.vm_id, row.running_seconds) for row in rollups] == [(running.id, 3600)]
+
+
+def test_usage_report_groups_and_filters(db):
+    db.add_all([
+        UsageDaily(day=date(2026, 1, 1), vm_id=1, owner_id=1, course="net", running_seconds=3600,
+                   core_seconds=7200, mb_seconds=1024 * 3600),
+        UsageDaily(day=date(2026, 1, 2), vm_id=2, owner_id=1, course="os", running_seconds=1800,
+                   core_seconds=1800, mb_seconds=0),
+        UsageDaily(day=date(2026, 1, 2), vm_id=3, owner_id=2, course="net", running_seconds=3600,
+                   core_seconds=3600, mb_seconds=0),
+        UsageDaily(day=date(2026, 1, 5), vm_id=3, owner_id=2, course="net", running_seconds=3600,
+                   core_seconds=3600, mb_seconds=0),
+    ])
+    db.commit()
+
+    by_user = usage_report(db, date(2026, 1, 1), date(2026, 1, 2), "user")
+    assert by_user == [
+        {"key": 1, "running_hours": 1.5, "core_hours": 2.5, "gb_hours": 1.0},
+        {"key": 2, "running_hours": 1.0, "core_hours": 1.0, "gb_hours": 0.0},
+    ]
+    by_course = usage_report(db, date(2026, 1, 1), date(2026, 1, 5), "course", owner_id=2)
+    assert by_course == [{"key": "net", "running_hours": 2.0, "core_hours": 2.0, "gb_hours": 0.0}]
@@ -0,0 +1,153 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.console import ConsoleConnection, ConsoleSession
+from app.models.virtual_machine import VMType
+from app.services import guacamole
+from app.services.guacamole import ConsoleBroker
+
+
+class FakeGuacamole:
+    url = "http://guacamole.test/guacamole"
+
+    def __init__(self):
+        self.connections = {}
+        self.users = {}
+
+    def create_connection(self, name, protocol, parameters):
+        connection_id = str(len(self.connections) + 1)
+        self.connections[connection_id] = parameters
+        return connection_id
+
+    def update_connection(self, connection_id, name, protocol, parameters):
+        self.connections[connection_id] = parameters
+
+    def delete_connection(self, connection_id):
+        del self.connections[connection_id]
+
+    def client_identifier(self, connection_id):
+        return f"client-{connection_id}"
+
+    def create_console_user(self, username, connection_id):
+        self.users[username] = connection_id
+        return f"token-{username}"
+
+    def delete_console_user(self, username, token=None):
+        del self.users[username]
+
+
+@pytest.fixture
+def guac(monkeypatch, session_factory):
+    monkeypatch.setattr(guacamole, "SessionLocal", session_factory)
+    return FakeGuacamole()
+
+
+@pytest.fixture
+def vm(make_vm):
+    return make_vm(vm_type=VMType.LXC, ip_address="10.0.0.5", ssh_enabled=True, ssh_port=22)
+
+
+def test_sessions_work_across_workers(guac, vm):
+    first, second = ConsoleBroker(guac), ConsoleBroker(guac)
+
+    async def scenario():
+        opened = await first.open_session(vm, vm.owner_id)
+        refreshed = await second.keepalive(opened["session_token"], vm.owner_id)
+        reopened = await second.open_session(vm, vm.owner_id)
+        await second.close_session(opened["session_token"], vm.owner_id)
+        return opened, refreshed, reopened
+
+    opened, refreshed, reopened = asyncio.run(scenario())
+
+    assert opened["protocol"] == "ssh"
+    # The browser gets the session user's token, never the broker's admin token
+    assert opened["guacamole_token"].startswith("token-console-")
+    assert refreshed["guacamole_token"] == opened["guacamole_token"]
+    assert reopened["connection_id"] == opened["connection_id"]
+    assert len(guac.connections) == 1
+    assert list(guac.users.values()) == [opened["connection_id"]]
+
+
+def test_sessions_are_private_to_their_user(guac, vm):
+    broker = ConsoleBroker(guac)
+
+    async def scenario():
+        opened = await broker.open_session(vm, vm.owner_id)
+        with pytest.raises(Exception, match="not found"):
+            await broker.keepalive(opened["session_token"], vm.owner_id + 1)
+        with pytest.raises(Exception, match="not found"):
+            await broker.close_session(opened["session_token"], vm.owner_id + 1)
+
+    asyncio.run(scenario())
+
+
+def test_changed_address_updates_the_connection(guac, vm):
+    broker = ConsoleBroker(guac)
+
+    async def scenario():
+        first = await broker.open_session(vm, vm.owner_id)
+        vm.ip_address = "10.0.0.6"
+        second = await broker.open_session(vm, vm.owner_id)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert second["connection_id"] == first["connection_id"]
+    assert guac.connections[first["connection_id"]]["hostname"] == "10.0.0.6"
+
+
+def test_connections_of_different_vms_are_created_in_parallel(guac, vm, make_vm):
+    other = make_vm(name="other", proxmox_id=101, vm_type=VMType.LXC, ip_address="10.0.0.7")
+    create_connection = guac.create_connection
+
+    def slow_create(name, protocol, parameters):
+        time.sleep(0.3)
+        return create_connection(name, protocol, parameters)
+
+    guac.create_connection = slow_create
+    broker = ConsoleBroker(guac)
+
+    async def scenario():
+        return await asyncio.gather(
+            broker._ensure_connection(vm, "ssh"),
+            broker._ensure_connection(vm, "ssh"),
+            broker._ensure_connection(other, "ssh")
+        )
+
+    started = time.monotonic()
+    first, again, second = asyncio.run(scenario())
+    # The two VMs overlap; the repeated request for one VM waits and reuses it
+    assert time.monotonic() - started < 0.55
+    assert first == again != second
+    assert len(guac.connections) == 2
+
+
+def test_cleanup_removes_expired_sessions_and_idle_connections(guac, vm, db):
+    broker = ConsoleBroker(guac)
+
+    async def scenario():
+        await broker.open_session(vm, vm.owner_id)
+        await broker.expire_vm(vm.id)
+        await broker.cleanup()
+
+    asyncio.run(scenario())
+
+    assert guac.users == {} and guac.connections == {}
+    assert db.query(ConsoleSession).count() == 0
+    assert db.query(ConsoleConnection).count() == 0
+
+
+def test_cleanup_keeps_connections_of_active_sessions(guac, vm, db):
+    broker = ConsoleBroker(guac)
+
+    async def scenario():
+        await broker.open_session(vm, vm.owner_id)
+        db.query(ConsoleConnection).update({"last_used": datetime.utcnow() - timedelta(days=1)})
+        db.commit()
+        await broker.cleanup()
+
+    asyncio.run(scenario())
+
+    assert len(guac.users) == 1 and len(guac.connections) == 1
@@ -0,0 +1,50 @@
+from app.services.discovery import read_dhcp_leases
+from app.services.proxmox import _parse_mac, _pick_agent_ipv4, _pick_lxc_ipv4
+
+
+def test_parse_mac_from_kvm_and_lxc_configs():
+    assert _parse_mac("virtio=bc:24:11:aa:bb:cc,bridge=vmbr0,firewall=1") == "BC:24:11:AA:BB:CC"
+    assert _parse_mac("e1000=BC:24:11:00:00:01,bridge=vmbr0") == "BC:24:11:00:00:01"
+    assert _parse_mac("name=eth0,bridge=vmbr0,hwaddr=bc:24:11:00:00:02,ip=dhcp,type=veth") == "BC:24:11:00:00:02"
+    assert _parse_mac("name=eth0,bridge=vmbr0,ip=dhcp") is None
+    assert _parse_mac("") is None
+
+
+def test_pick_agent_ipv4_prefers_the_configured_nic():
+    interfaces = [
+        {"name": "lo", "hardware-address": "00:00:00:00:00:00",
+         "ip-addresses": [{"ip-address-type": "ipv4", "ip-address": "127.0.0.1"}]},
+        {"name": "docker0", "hardware-address": "02:42:00:00:00:01",
+         "ip-addresses": [{"ip-address-type": "ipv4", "ip-address": "172.17.0.1"}]},
+        {"name": "eth0", "hardware-address": "bc:24:11:aa:bb:cc",
+         "ip-addresses": [{"ip-address-type": "ipv6", "ip-address": "fe80::1"},
+                          {"ip-address-type": "ipv4", "ip-address": "10.0.0.5"}]},
+    ]
+
+    assert _pick_agent_ipv4(interfaces, "BC:24:11:AA:BB:CC") == "10.0.0.5"
+    assert _pick_agent_ipv4([interfaces[0], interfaces[2]], None) == "10.0.0.5"
+    assert _pick_agent_ipv4(interfaces[:1], None) is None
+
+
+def test_pick_lxc_ipv4_skips_loopback_and_link_local():
+    interfaces = [
+        {"name": "lo", "hwaddr": "00:00:00:00:00:00", "inet": "127.0.0.1/8"},
+        {"name": "eth1", "hwaddr": "bc:24:11:00:00:09", "inet": "169.254.3.4/16"},
+        {"name": "eth0", "hwaddr": "bc:24:11:00:00:02", "inet": "10.0.0.7/24"},
+    ]
+
+    assert _pick_lxc_ipv4(interfaces, "BC:24:11:00:00:02") == "10.0.0.7"
+    assert _pick_lxc_ipv4(interfaces[:2], None) is None
+
+
+def test_read_dhcp_leases(tmp_path):
+    leases = tmp_path / "dnsmasq.leases"
+    leases.write_text(
+        "1700000000 bc:24:11:00:00:01 10.0.0.20 vm1 01:bc:24:11:00:00:01\n"
+        "1700000000 bc:24:11:00:00:02 fd00::2 vm2 *\n"
+        "garbage\n"
+    )
+
+    assert read_dhcp_leases(str(leases)) == {"BC:24:11:00:00:01": "10.0.0.20"}
+    assert read_dhcp_leases(str(tmp_path / "missing")) == {}
+    assert read_dhcp_leases(None) == {}
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.drain import NodeDrain
+from app.services.drain import DrainConflict, DrainJob, get_drain_job, plan_drain, prune_drain_jobs
+
+GB = 1024 ** 3
+
+
+def _node(name, maxmem, mem=0, status="online"):
+    return {"node": name, "maxmem": maxmem, "mem": mem, "status": status}
+
+
+def _guest(vmid, maxmem, status="running"):
+    return {"vmid": vmid, "name": f"vm{vmid}", "type": "qemu", "maxmem": maxmem, "status": status}
+
+
+def test_plan_drain_places_largest_guests_on_freest_nodes():
+    nodes = [_node("src", 64 * GB), _node("a", 10 * GB), _node("b", 20 * GB)]
+    guests = [_guest(1, 2 * GB), _guest(2, 8 * GB), _guest(3, 4 * GB, status="stopped")]
+
+    moves = plan_drain(nodes, guests, "src", memory_headroom=0)
+
+    assert [(move["vmid"], move["target"]) for move in moves] == [(2, "b"), (3, "b"), (1, "a")]
+    assert [move["running"] for move in moves] == [True, False, True]
+    assert all(move["status"] == "planned" for move in moves)
+
+
+def test_plan_drain_keeps_headroom_and_reports_unplaced_guests():
+    nodes = [_node("src", 64 * GB), _node("a", 10 * GB, mem=4 * GB)]
+    guests = [_guest(1, 6 * GB), _guest(2, 1 * GB)]
+
+    moves = plan_drain(nodes, guests, "src", memory_headroom=0.1)
+
+    assert moves[0]["target"] is None and moves[0]["status"] == "unplaced"
+    assert moves[1]["target"] == "a"
+
+
+def test_plan_drain_skips_offline_and_unlisted_targets():
+    nodes = [_node("src", 64 * GB), _node("a", 64 * GB, status="offline"), _node("b", 8 * GB), _node("c", 32 * GB)]
+
+    moves = plan_drain(nodes, [_guest(1, 1 * GB)], "src", targets=["a", "b"])
+
+    assert moves[0]["target"] == "b"
+
+
+def test_claim_refuses_a_second_job_for_the_same_node(db):
+    first = DrainJob("default", "pve1")
+    first.claim(db)
+    DrainJob("default", "pve2").claim(db)
+    DrainJob("other", "pve1").claim(db)
+
+    with pytest.raises(DrainConflict) as conflict:
+        DrainJob("default", "pve1").claim(db)
+    assert conflict.value.job_id == first.id
+    assert get_drain_job(db, first.id)["status"] == "planning"
+
+
+def test_prune_interrupts_stale_jobs_and_forgets_old_ones(db):
+    now = datetime.utcnow()
+    stale = DrainJob("default", "pve1")
+    stale.claim(db)
+    db.query(NodeDrain).filter(NodeDrain.id == stale.id).update({"heartbeat_at": now - timedelta(hours=1)})
+    old = DrainJob("default", "pve2")
+    old.claim(db)
+    db.query(NodeDrain).filter(NodeDrain.id == old.id).update(
+        {"status": "completed", "active_key": None, "finished_at": now - timedelta(days=2)}
+    )
+    db.commit()
+
+    prune_drain_jobs(db, retention=24 * 3600)
+
+    assert get_drain_job(db, stale.id)["status"] == "interrupted"
+    assert get_drain_job(db, old.id) is None
+    DrainJob("default", "pve1").claim(db)  # The node can be drained again
@@ -0,0 +1,27 @@
+import asyncio
+
+from app import main
+
+
+def test_background_tasks_start_once_the_lock_holder_exits(monkeypatch, tmp_path):
+    started = []
+    for name in ("console_broker", "network_discovery", "snapshot_pruner", "usage_accountant"):
+        monkeypatch.setattr(getattr(main, name), "start", lambda name=name: started.append(name))
+    monkeypatch.setattr(main, "BACKGROUND_LOCK_RETRY", 0.01)
+    path = tmp_path / "background.lock"
+
+    async def run():
+        holder = open(path, "a")
+        assert main._try_background_lock(holder)
+        with open(path, "a") as lock_file:
+            background = asyncio.get_running_loop().create_task(main._run_background_tasks(lock_file))
+            await asyncio.sleep(0.05)
+            assert started == [] and main.task_tailer.apply is False
+
+            holder.close()
+            await asyncio.wait_for(background, 1)
+            await main.task_tailer.stop()
+        return main.task_tailer.apply
+
+    assert asyncio.run(run()) is True
+    assert sorted(started) == ["console_broker", "network_discovery", "snapshot_pruner", "usage_accountant"]
@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+from app.models.virtual_machine import VMType
+from app.services import proxmox as proxmox_module
+from app.services.proxmox import ProxmoxService
+
+
+def test_connect_logs_in_off_the_event_loop(monkeypatch):
+    def slow_login(cluster_id):
+        time.sleep(0.3)
+        return object()
+
+    monkeypatch.setattr(proxmox_module.cluster_registry, "client", slow_login)
+
+    async def main():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.get_running_loop().create_task(tick())
+        service = await ProxmoxService.connect()
+        ticker.cancel()
+        return service, ticks
+
+    service, ticks = asyncio.run(main())
+    assert service.cluster_id == "default"
+    assert ticks > 10
+
+
+def test_vm_actions_address_each_guest_by_its_type(fake_proxmox):
+    async def main():
+        proxmox = await ProxmoxService.connect()
+        await proxmox.vm_action(101, "start", VMType.LXC)
+        return await proxmox.vm_action_bulk({100: VMType.KVM, 103: VMType.LXC, 102: VMType.LXC}, "start")
+
+    errors = asyncio.run(main())
+    assert [fake_proxmox.guests[vmid]["status"] for vmid in (100, 101, 103)] == ["running"] * 3
+    assert errors[100] is None and errors[103] is None
+    assert "does not exist" in errors[102]
+
+
+def test_create_retries_under_a_new_vmid_when_the_reserved_one_is_taken(fake_proxmox):
+    async def main():
+        proxmox = await ProxmoxService.connect()
+        vmid = proxmox._get_next_vmid()
+        # Another worker creates a guest under the same ID first
+        fake_proxmox.add_guest(vmid, "node1", "qemu", "elsewhere")
+        created = await proxmox._build_guest(VMType.LXC, vmid, "retried", 1, 512, 8, "node2")
+        return vmid, created
+
+    taken, created = asyncio.run(main())
+    assert created != taken
+    assert fake_proxmox.guests[created]["name"] == "retried"
+    assert fake_proxmox.guests[created]["type"] == "lxc"
+    assert not proxmox_module._reserved_vmids["default"]
+
+
+def test_batch_rolls_back_created_vms_when_an_item_fails(fake_proxmox):
+    progress = []
+
+    async def main():
+        proxmox = await ProxmoxService.connect()
+        return await proxmox.create_vms_batch(
+            [{"name": f"lab-{i}"} for i in range(4)],
+            VMType.KVM, 1, 512, 8,
+            nodes=["node1", "missing"],
+            rollback_on_failure=True,
+            on_progress=lambda result: progress.append((result["index"], result["status"]))
+        )
+
+    results = asyncio.run(main())
+    assert [result["status"] for result in results] == ["rolled_back", "failed"] * 2
+    assert "no such node" in results[1]["error"]
+    assert not any(guest["name"].startswith("lab-") for guest in fake_proxmox.guests.values())
+    assert sorted(progress) == [(0, "created"), (0, "rolled_back"), (1, "failed"),
+                                (2, "created"), (2, "rolled_back"), (3, "failed")]
+
+
+def test_batch_reports_a_create_task_that_fails_as_failed(fake_proxmox):
+    fake_proxmox.failing_tasks.add("lxccreate")
+
+    async def main():
+        proxmox = await ProxmoxService.connect()
+        return await proxmox.create_vms_batch([{"name": "lab"}], VMType.LXC, 1, 512, 8)
+
+    [result] = asyncio.run(main())
+    assert result["status"] == "failed"
+    assert "command failed" in result["error"]
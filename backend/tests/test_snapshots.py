@@ -0,0 +1,43 @@
+import asyncio
+
+from app.models.virtual_machine import PinnedSnapshot, VMType
+from app.services import snapshots
+from app.services.proxmox import ProxmoxService
+from app.services.snapshots import SnapshotPruner
+
+
+def _take(cluster, vmid, names):
+    """Give guest ``vmid`` a linear chain of snapshots, oldest first."""
+    chain = cluster.guests[vmid].setdefault("snapshots", [])
+    for i, name in enumerate(names):
+        chain.append({"name": name, "description": "", "snaptime": 1000 + i,
+                      "parent": chain[-1]["name"] if chain else None})
+
+
+def _names(cluster, vmid):
+    return [s["name"] for s in cluster.guests[vmid]["snapshots"]]
+
+
+def test_prune_keeps_the_newest_and_pinned_snapshots(fake_proxmox):
+    _take(fake_proxmox, 100, ["exam", "s1", "s2", "s3", "s4"])
+
+    async def main():
+        proxmox = await ProxmoxService.connect()
+        return await proxmox.prune_snapshots(100, VMType.KVM, keep=2, pinned={"exam"})
+
+    assert asyncio.run(main()) == 2
+    assert _names(fake_proxmox, 100) == ["exam", "s3", "s4"]
+
+
+def test_pruner_protects_pinned_checkpoints_from_newer_snapshots(fake_proxmox, session_factory, db, make_vm, monkeypatch):
+    monkeypatch.setattr(snapshots, "SessionLocal", session_factory)
+    checkpoint = make_vm(proxmox_id=100, proxmox_node="node1", cluster_id="default")
+    make_vm(name="other", proxmox_id=101, proxmox_node="node2", vm_type=VMType.LXC, cluster_id="default")
+    db.add(PinnedSnapshot(vm_id=checkpoint.id, name="exam", pinned_by=1))
+    db.commit()
+    _take(fake_proxmox, 100, ["exam"] + [f"s{i}" for i in range(6)])
+    _take(fake_proxmox, 101, ["exam"] + [f"s{i}" for i in range(6)])
+
+    assert asyncio.run(SnapshotPruner(keep=5).prune()) == 3
+    assert _names(fake_proxmox, 100) == ["exam", "s1", "s2", "s3", "s4", "s5"]
+    assert _names(fake_proxmox, 101) == ["s1", "s2", "s3", "s4", "s5"]
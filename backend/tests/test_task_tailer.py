@@ -0,0 +1,99 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.services import task_tailer as task_tailer_module
+from app.services.clusters import VMNodeCache
+from app.services.task_tailer import TASK_TAIL_LOOKBACK, TaskTailer
+
+
+def _task(upid, endtime, starttime=None, **fields):
+    return {"upid": upid, "endtime": endtime, "starttime": starttime or endtime - 1, **fields}
+
+
+def test_first_poll_only_seeds_the_cursor():
+    tailer = TaskTailer()
+    history = [_task("a", 100), _task("b", 200), _task("c", 200), {"upid": "running", "starttime": 250}]
+
+    assert tailer._new_tasks("pve", history) == []
+    assert tailer.cursors["pve"] == {"newest": 200, "seen": {"a": 100, "b": 200, "c": 200}}
+
+
+def test_new_tasks_skips_seen_tasks_and_returns_oldest_first():
+    tailer = TaskTailer()
+    tailer._new_tasks("pve", [_task("a", 100), _task("b", 200)])
+
+    tasks = [_task("a", 100), _task("b", 200), _task("d", 300), _task("c", 200, starttime=150)]
+    assert [task["upid"] for task in tailer._new_tasks("pve", tasks)] == ["c", "d"]
+    assert tailer._new_tasks("pve", tasks) == []
+    assert tailer.cursors["pve"]["newest"] == 300
+
+
+def test_new_tasks_tracks_every_task_finished_in_the_newest_second():
+    tailer = TaskTailer()
+    tailer._new_tasks("pve", [])
+
+    assert [task["upid"] for task in tailer._new_tasks("pve", [_task("a", 100)])] == ["a"]
+    tasks = [_task("a", 100), _task("b", 100)]
+    assert [task["upid"] for task in tailer._new_tasks("pve", tasks)] == ["b"]
+    assert set(tailer.cursors["pve"]["seen"]) == {"a", "b"}
+
+
+def test_new_tasks_picks_up_tasks_that_arrive_late():
+    tailer = TaskTailer()
+    tailer._new_tasks("pve", [_task("a", 1000)])
+
+    # pve2's task ended first but its broadcast arrives after pve1's newer one
+    assert [task["upid"] for task in tailer._new_tasks("pve", [_task("a", 1000), _task("b", 1200)])] == ["b"]
+    tasks = [_task("a", 1000), _task("b", 1200), _task("c", 1100)]
+    assert [task["upid"] for task in tailer._new_tasks("pve", tasks)] == ["c"]
+    assert tailer._new_tasks("pve", tasks) == []
+
+
+def test_new_tasks_forgets_tasks_outside_the_lookback():
+    tailer = TaskTailer()
+    tailer._new_tasks("pve", [_task("a", 1000)])
+    tailer._new_tasks("pve", [_task("b", 1000 + TASK_TAIL_LOOKBACK + 1)])
+
+    assert set(tailer.cursors["pve"]["seen"]) == {"b"}
+    # Too old to be a late arrival, so it is not replayed either
+    assert tailer._new_tasks("pve", [_task("a", 1000)]) == []
+
+
+def test_cursors_are_per_cluster():
+    tailer = TaskTailer()
+    tailer._new_tasks("a", [_task("x", 100)])
+
+    assert tailer._new_tasks("b", [_task("x", 100)]) == []
+    assert [task["upid"] for task in tailer._new_tasks("b", [_task("y", 101)])] == ["y"]
+
+
+class FakeProxmox:
+    def __init__(self, tasks):
+        self.proxmox = SimpleNamespace(cluster=SimpleNamespace(tasks=SimpleNamespace(get=lambda: tasks)))
+        self.node_cache = VMNodeCache()
+
+
+def test_follow_only_mode_drops_cached_nodes_without_applying(monkeypatch):
+    history = [_task("UPID:old", 100, type="qmstart", id="101", node="pve1", status="OK")]
+    tasks = list(history)
+    proxmox = FakeProxmox(tasks)
+    proxmox.node_cache.refresh({101: "pve1", 102: "pve1"})
+
+    async def connect(cluster_id):
+        return proxmox
+
+    monkeypatch.setattr(task_tailer_module, "ProxmoxService", SimpleNamespace(connect=connect))
+    applied = []
+    monkeypatch.setattr(TaskTailer, "_apply", lambda self, *args: applied.append(args))
+
+    tailer = TaskTailer()
+    tailer.apply = False
+    queue = tailer.subscribe()
+    asyncio.run(tailer.poll_cluster("default"))
+    tasks.append(_task("UPID:migrate", 200, type="qmigrate", id="101", node="pve1", status="OK"))
+    events = asyncio.run(tailer.poll_cluster("default"))
+
+    assert [event["upid"] for event in events] == ["UPID:migrate"]
+    assert proxmox.node_cache.get(101) is None
+    assert proxmox.node_cache.get(102) == "pve1"
+    assert applied == [] and queue.empty()
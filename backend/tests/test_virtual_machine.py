@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from app.models.usage import UsageEvent
+from app.models.user import User, UserRole
+from app.models.virtual_machine import PinnedSnapshot, VirtualMachine, VMType
+from app.routers import virtual_machine
+from app.schemas.virtual_machine import VMBatchCreate, VMBulkSnapshot
+
+
+def _users(db):
+    teacher = User(id=1, username="teacher", email="t@example.com", hashed_password="x", role=UserRole.TEACHER)
+    students = [
+        User(id=10 + i, username=f"s{i}", email=f"s{i}@example.com", hashed_password="x", role=UserRole.STUDENT)
+        for i in range(3)
+    ]
+    db.add_all([teacher, *students])
+    db.commit()
+    return teacher, students
+
+
+def test_streamed_batch_reports_every_item_then_the_result(fake_proxmox, session_factory, db, monkeypatch):
+    monkeypatch.setattr(virtual_machine, "SessionLocal", session_factory)
+    teacher, students = _users(db)
+    batch = VMBatchCreate(
+        name_prefix="lab", vm_type=VMType.LXC, owner_ids=[s.id for s in students],
+        nodes=["node1", "node2"], course="net101"
+    )
+
+    async def main():
+        response = await virtual_machine.create_vm_batch(batch, stream=True, current_user=teacher, db=db)
+        return [json.loads(line) async for line in response.body_iterator]
+
+    lines = asyncio.run(main())
+    assert [line["event"] for line in lines] == ["item"] * 3 + ["done"]
+    assert sorted(line["name"] for line in lines[:3]) == ["lab-s0", "lab-s1", "lab-s2"]
+    done = lines[-1]
+    assert done["created"] == 3 and done["failed"] == 0
+
+    rows = {vm.id: vm for vm in db.query(VirtualMachine).all()}
+    assert sorted(item["vm_id"] for item in done["items"]) == sorted(rows)
+    for item in done["items"]:
+        vm = rows[item["vm_id"]]
+        assert (vm.proxmox_id, vm.owner_id, vm.course) == (item["proxmox_id"], item["owner_id"], "net101")
+        assert vm.provisioned_by == teacher.id
+    assert db.query(UsageEvent).count() == 3
+
+
+def test_teachers_reach_the_course_vms_they_provisioned(db):
+    teacher, students = _users(db)
+    other = User(id=2, username="other", email="o@example.com", hashed_password="x", role=UserRole.TEACHER)
+    db.add(other)
+    db.add_all([
+        VirtualMachine(
+            name=f"lab-{student.username}", vm_type=VMType.KVM, cluster_id="default", proxmox_id=100 + i,
+            proxmox_node="node1", course="net101", owner_id=student.id, provisioned_by=teacher.id
+        )
+        for i, student in enumerate(students)
+    ])
+    db.commit()
+
+    by_course = VMBulkSnapshot(snapshot="exam", course="net101")
+    assert {vm.owner_id for vm in virtual_machine._select_bulk_vms(by_course, teacher, db)} == {10, 11, 12}
+    assert virtual_machine._select_bulk_vms(by_course, other, db) == []
+
+    vm_id = db.query(VirtualMachine).first().id
+    with pytest.raises(HTTPException) as excinfo:
+        virtual_machine._select_bulk_vms(VMBulkSnapshot(snapshot="exam", vm_ids=[vm_id]), other, db)
+    assert excinfo.value.status_code == 404
+    assert virtual_machine._get_accessible_vm(vm_id, teacher, db).id == vm_id
+
+
+def test_bulk_snapshots_are_pinned(fake_proxmox, db):
+    teacher, students = _users(db)
+    db.add_all([
+        VirtualMachine(
+            name=f"lab-{student.username}", vm_type=VMType.KVM if i % 2 == 0 else VMType.LXC, cluster_id="default",
+            proxmox_id=100 + i, proxmox_node="node1", course="net101", owner_id=student.id, provisioned_by=teacher.id
+        )
+        for i, student in enumerate(students)
+    ])
+    db.commit()
+
+    items = asyncio.run(virtual_machine.bulk_snapshot(
+        VMBulkSnapshot(snapshot="exam", course="net101"), current_user=teacher, db=db
+    ))
+    assert all(item["ok"] for item in items)
+    pins = db.query(PinnedSnapshot).all()
+    assert sorted(pin.vm_id for pin in pins) == sorted(item["vm_id"] for item in items)
+    assert {(pin.name, pin.pinned_by) for pin in pins} == {("exam", teacher.id)}
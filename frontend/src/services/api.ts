@@ -8,6 +8,7 @@ import {
   VMActionData,
   ProfileUpdateData,
   VMMetricsResponse,
+  ConsoleSession,
   User,
   VM,
 } from '../types';
@@ -120,6 +121,22 @@ class ApiService {
     return this.get<VMMetricsResponse>(`/vm/${vmId}/metrics`);
   }
 
+  // Console sessions
+  async openConsole(vmId: number, protocol?: 'vnc' | 'rdp' | 'ssh') {
+    return this.post<ConsoleSession>(`/console/${vmId}`, { protocol });
+  }
+
+  async keepaliveConsole(sessionToken: string) {
+    return this.post<ConsoleSession>(
+      `/console/sessions/${sessionToken}/keepalive`,
+      {}
+    );
+  }
+
+  async closeConsole(sessionToken: string) {
+    return this.delete<void>(`/console/sessions/${sessionToken}`);
+  }
+
   // Error handling
   private handleError(error: unknown) {
     if (error instanceof AxiosError) {
@@ -44,6 +44,7 @@ export interface VM {
   name: string;
   vm_type: VMType;
   status: VMStatus;
+  cluster_id?: string;
   proxmox_id: number;
   proxmox_node: string;
   cpu_cores: number;
@@ -62,6 +63,17 @@ export interface VM {
   owner_name?: string;
 }
 
+export interface ConsoleSession {
+  session_token: string;
+  expires_at: number;
+  vm_id: number;
+  protocol: 'vnc' | 'rdp' | 'ssh';
+  connection_id: string;
+  client_identifier: string;
+  guacamole_url: string;
+  guacamole_token: string;
+}
+
 export interface TokenResponse {
   access_token: string;
   token_type: string;